@@ -1,7 +1,9 @@
 from __future__ import annotations
 import pygame
-from typing import Optional
+from typing import Optional, Tuple
 from settings import *
+from spatial import SpatialIndex
+from assets import ASSETS
 
 
 class Actor:
@@ -13,29 +15,164 @@ class Actor:
 
     === Public Attributes ===
     x:
-        x coordinate of this actor's location on the stage
+        x coordinate of the tile this actor is in on the stage
     y:
-        y coordinate of this actor's location on the stage
+        y coordinate of the tile this actor is in on the stage
+    sub_x:
+        how far right of its tile this actor is, in steps of 1 / SUBTILE of
+        a tile; 0 unless this actor is part way between two tiles
+    sub_y:
+        how far below its tile this actor is, in steps of 1 / SUBTILE of a
+        tile; 0 unless this actor is part way between two tiles
     icon:
-        the image representing this actor
+        the image representing this actor, shared with every other actor
+        using the same image file
+    kind:
+        the kind of actor this is (see settings), the same for every actor
+        of its class
+    idle:
+        true iff moving this actor does nothing, the same for every actor of
+        its class, so that a game need not move it on each tick
+    scheduled:
+        true iff this actor only moves on the ticks it is scheduled for (see
+        Game.schedule), rather than on every tick, the same for every actor
+        of its class
     """
+    # === Private Attributes ===
+    # _icon_file:
+    #       the image file this actor's icon is loaded from
+    # _x:
+    #       storage for this actor's x coordinate
+    # _y:
+    #       storage for this actor's y coordinate
+    # _index:
+    #       the spatial index of the game this actor is in, which must be
+    #       told whenever this actor changes position
+    # _state_fields:
+    #       the names of the attributes that make up this actor's state
+    #       while a game runs, which a snapshot of the game saves
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = OTHER
+    idle: bool = False
+    scheduled: bool = False
+
+    # Only actors that move part way between tiles keep a sub-tile offset,
+    # so every other actor shares these
+    sub_x: int = 0
+    sub_y: int = 0
+
+    _icon_file: str
+    _x: int
+    _y: int
+    _index: Optional[SpatialIndex]
+    _state_fields: Tuple[str, ...] = ('_x', '_y')
+
+    # Every actor class lists the attributes it adds in __slots__, so that
+    # actors have no __dict__ and a level can hold a great many of them
+    __slots__ = ('_icon_file', '_x', '_y', '_index')
 
     def __init__(self, icon_file, x, y):
         """Initialize an actor with the given image <icon_file> and the
         given <x> and <y> position on the game's stage.
         """
 
-        self.x, self.y = x, y
-        self.icon = pygame.image.load(icon_file)
+        self._index = None
+        self._x, self._y = x, y
+        self._icon_file = icon_file
+
+    @property
+    def icon(self) -> pygame.Surface:
+        """Return the image representing this actor, loading it the first
+        time any actor using its image file is drawn."""
+
+        return ASSETS.get_icon(self._icon_file)
+
+    @property
+    def x(self) -> int:
+        """Return the x coordinate of this actor."""
+
+        return self._x
+
+    @x.setter
+    def x(self, value: int) -> None:
+        """Move this actor to the x coordinate <value>."""
+
+        old_x = self._x
+        self._x = value
+        if self._index is not None and value != old_x:
+            self._index.relocate(self, old_x, self._y)
+
+    @property
+    def y(self) -> int:
+        """Return the y coordinate of this actor."""
+
+        return self._y
+
+    @y.setter
+    def y(self, value: int) -> None:
+        """Move this actor to the y coordinate <value>."""
+
+        old_y = self._y
+        self._y = value
+        if self._index is not None and value != old_y:
+            self._index.relocate(self, self._x, old_y)
 
     def move(self, game: 'Game') -> None:
         """Move this actor by taking one step of its animation."""
 
         raise NotImplementedError
 
+    def get_wait(self, game: 'Game') -> int:
+        """Return the number of ticks after the current one of the <game>
+        this actor next moves on, at least 1, if it is scheduled. This is
+        worked out from its state fields when it is added to the game."""
+
+        return 1
+
+    def set_wait(self, game: 'Game', ticks: int) -> None:
+        """Set this actor's state fields to say that it next moves on the
+        tick <ticks> ticks after the current one of the <game>, if it is
+        scheduled, so that get_wait returns <ticks>."""
+
+        pass
+
+    def get_state(self) -> tuple:
+        """Return the values of this actor's state fields."""
+
+        return tuple(getattr(self, name) for name in self._state_fields)
+
+    def set_state(self, state: tuple) -> None:
+        """Set this actor's state fields to the values in <state>, as
+        returned by get_state. This must only be done to an actor that is
+        not in a game, as it does not tell the spatial index."""
+
+        for name, value in zip(self._state_fields, state):
+            setattr(self, name, value)
+
+    @classmethod
+    def from_state(cls, icon_file: str, state: tuple) -> Actor:
+        """Return a new actor of this class with the image <icon_file> and
+        the given <state>, as returned by get_state."""
+
+        actor = cls.__new__(cls)
+        actor._index = None
+        actor._icon_file = icon_file
+        actor.set_state(state)
+        return actor
+
+    def get_icon_file(self) -> str:
+        """Return the image file this actor's icon is loaded from."""
+
+        return self._icon_file
+
+    def get_subtile_position(self) -> Tuple[int, int]:
+        """Return the position of this actor on the stage in steps of
+        1 / SUBTILE of a tile, counting its sub-tile offset."""
+
+        return self._x * SUBTILE + self.sub_x, self._y * SUBTILE + self.sub_y
+
 
 class Player(Actor):
     """
@@ -48,13 +185,17 @@ class Player(Actor):
     #       keep track of the last key the user pushed down
     # _smooth_move:
     #       represent on/off status for smooth player movement
+    __slots__ = ('_stars_collected', '_last_event', '_smooth_move')
 
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = PLAYER
     _stars_collected: int
     _last_event: Optional[int]
     _smooth_move: bool
+    _state_fields = Actor._state_fields + ('_stars_collected', '_last_event',
+                                           '_smooth_move')
 
     def __init__(self, icon_file: str, x: int, y: int) -> None:
         """Initalize a Player with the given image <icon_file> at the position
@@ -79,6 +220,14 @@ class Player(Actor):
 
         return self._stars_collected
 
+    def get_last_event(self) -> Optional[int]:
+        """
+        Return the last key the user pushed down that the player has not
+        acted on yet.
+        """
+
+        return self._last_event
+
     def register_event(self, event: int) -> None:
         """
         Keep track of the last key <event> the user made.
@@ -97,32 +246,35 @@ class Player(Actor):
             dx, dy = 0, 0
             if self._smooth_move:
 
-                actor_left, actor_right = game.get_actor(self.x - 1, self.y), game.get_actor(self.x + 1, self.y)
-                actor_up, actor_down = game.get_actor(self.x, self.y - 1), game.get_actor(self.x, self.y + 1)
+                # Read what is next to the player before pushing anything.
+                # A push only moves boxes away from the player, so a box
+                # found here is still there when it is pushed.
+                kind_left, kind_right = game.get_kind(self.x - 1, self.y), game.get_kind(self.x + 1, self.y)
+                kind_up, kind_down = game.get_kind(self.x, self.y - 1), game.get_kind(self.x, self.y + 1)
 
                 if game.keys_pressed[pygame.K_LEFT] or game.keys_pressed[pygame.K_a]:
-                    if not isinstance(actor_left, Wall):
+                    if kind_left != WALL:
                         dx -= 1
-                        if isinstance(actor_left, Box):
-                            if not actor_left.be_pushed(game, dx, dy):
+                        if kind_left == BOX:
+                            if not game.get_actor(self.x - 1, self.y).be_pushed(game, dx, dy):
                                 dx += 1
                 if game.keys_pressed[pygame.K_RIGHT] or game.keys_pressed[pygame.K_d]:
-                    if not isinstance(actor_right, Wall):
+                    if kind_right != WALL:
                         dx += 1
-                        if isinstance(actor_right, Box):
-                            if not actor_right.be_pushed(game, dx, dy):
+                        if kind_right == BOX:
+                            if not game.get_actor(self.x + 1, self.y).be_pushed(game, dx, dy):
                                 dx -= 1
                 if game.keys_pressed[pygame.K_UP] or game.keys_pressed[pygame.K_w]:
-                    if not isinstance(actor_up, Wall):
+                    if kind_up != WALL:
                         dy -= 1
-                        if isinstance(actor_up, Box):
-                            if not actor_up.be_pushed(game, dx, dy):
+                        if kind_up == BOX:
+                            if not game.get_actor(self.x, self.y - 1).be_pushed(game, dx, dy):
                                 dy += 1
                 if game.keys_pressed[pygame.K_DOWN] or game.keys_pressed[pygame.K_s]:
-                    if not isinstance(actor_down, Wall):
+                    if kind_down != WALL:
                         dy += 1
-                        if isinstance(actor_down, Box):
-                            if not actor_down.be_pushed(game, dx, dy):
+                        if kind_down == BOX:
+                            if not game.get_actor(self.x, self.y + 1).be_pushed(game, dx, dy):
                                 dy -= 1
 
             else:  # Precise movement used by the squishy monster level
@@ -138,10 +290,11 @@ class Player(Actor):
 
             new_x, new_y = self.x + dx, self.y + dy
 
-            if isinstance(game.get_actor(new_x, new_y), Star):
+            if game.get_kind(new_x, new_y) == STAR:
                 self._stars_collected += 1
+                game.stars_collected += 1
                 game.remove_actor(game.get_actor(new_x, new_y))
-            if isinstance(game.get_actor(new_x, new_y), Key):
+            if game.get_kind(new_x, new_y) == KEY:
                 game.key_collected = True
                 game.remove_actor(game.get_actor(new_x, new_y))
             self.x, self.y = new_x, new_y
@@ -156,6 +309,9 @@ class Star(Actor):
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = STAR
+    idle: bool = True
+    __slots__ = ()
 
     def move(self, game: 'Game') -> None:
         """
@@ -172,6 +328,9 @@ class Wall(Actor):
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = WALL
+    idle: bool = True
+    __slots__ = ()
 
     def move(self, game: 'Game') -> None:
         """
@@ -190,6 +349,9 @@ class Box(Actor):
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = BOX
+    idle: bool = True
+    __slots__ = ()
 
     def move(self, game: 'Game') -> None:
         """
@@ -202,23 +364,29 @@ class Box(Actor):
         """
         Move the box in the direction that it is being pushed,
         represented by <dx> and <dy> if the way is not blocked by a wall.
-        If there is another box in the way, move both boxes at once. maybe: use be_pushed (recursion)
+        If there is another box in the way, push it on too, and so on down a
+        chain of boxes of any length. A box further down the chain that is
+        blocked by a wall stays put, while the ones before it still move.
         If there is a monster in the way, squish the monster.
         Return True if a move was possible, and False otherwise.
         """
 
-        new_x, new_y = self.x + dx, self.y + dy
-        pushed = False
-        actor = game.get_actor(new_x, new_y)
-        if not isinstance(actor, Wall):
-            pushed = True
-            self.x, self.y = new_x, new_y
-            if isinstance(actor, Box):
-                actor.be_pushed(game, dx, dy)
-            if isinstance(actor, Monster):
-                actor.die(game)
+        box = self
+        while True:
+            new_x, new_y = box.x + dx, box.y + dy
+            kind = game.get_kind(new_x, new_y)
+            if kind == WALL:
+                return box is not self
 
-        return pushed
+            actor = game.get_actor(new_x, new_y) if kind in (BOX, MONSTER) else None
+            box.x, box.y = new_x, new_y
+            if kind == MONSTER:
+                actor.die(game)
+            # A push of no distance finds the box itself in the way, so it
+            # does not go on down the chain
+            if kind != BOX or (dx == 0 and dy == 0):
+                return True
+            box = actor
 
 # === Classes for monsters === #
 
@@ -233,16 +401,22 @@ class Monster(Actor):
     # _dy:
     #   the vertical distance this monster will move during each step
     # _delay:
-    #   the speed the monster moves at
+    #   the time in seconds the monster waits between steps
     # _delay_count:
-    #   used to keep track of the monster's delay in speed
+    #   used to keep track of the monster's delay in speed, in ticks; a
+    #   scheduled monster only brings it up to date when asked to (see
+    #   set_wait)
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = MONSTER
     _dx: float
     _dy: float
-    _delay: int
+    _delay: float
     _delay_count: int
+    _state_fields = Actor._state_fields + ('_dx', '_dy', '_delay',
+                                           '_delay_count')
+    __slots__ = ('_dx', '_dy', '_delay', '_delay_count')
 
     def __init__(self, icon_file: str, x: int, y: int, dx: float, dy: float) -> None:
         """Initalize a monster with the given <icon_file> as its image,
@@ -253,74 +427,108 @@ class Monster(Actor):
         super().__init__(icon_file, x, y)
         self._dx = dx
         self._dy = dy
-        self._delay = 5
+        self._delay = SQUISHY_STEP_TIME
         self._delay_count = 1
 
     def move(self, game: 'Game') -> None:
-        """Move the monster by taking one step in its animation."""
+        """Move the monster by taking one step in its animation. The game
+        finds out whether the monster has hit the player as it moves (see
+        collisions.py)."""
 
         raise NotImplementedError
 
-    def check_player_death(self, game: 'Game') -> None:
-        """Make the game over if this monster has hit the player."""
-
-        if isinstance(game.get_actor(self.x, self.y), Player):
-            game.game_over()
-        if game.player:
-            if self.x == game.player.x:
-                if self.y == game.player.y:
-                    game.game_over()
-
 
 class GhostMonster(Monster):
     """
     A class to represent a ghost in the game who chases the Player.
     """
+    # === Private attributes ===
+    # _heading:
+    #   the tile the ghost is moving to, or None if it is not moving
     x: int
     y: int
+    sub_x: int
+    sub_y: int
     icon: pygame.Surface
     _dx: float
     _dy: float
-    _delay: int
+    _delay: float
     _delay_count: int
+    _heading: Optional[Tuple[int, int]]
+    _state_fields = Monster._state_fields + ('sub_x', 'sub_y', '_heading')
+    __slots__ = ('sub_x', 'sub_y', '_heading')
 
     def __init__(self, icon_file: str, x: int, y: int) -> None:
         """Initalize a ghost with the given <icon_file> and <x> and <y>
         as its position."""
 
-        # Set movement with each animation to be 0.5
-        super().__init__(icon_file, x, y, 0.5, 0.5)  # uses Monster.__init__
+        # Set movement to be GHOST_SPEED tiles per second
+        super().__init__(icon_file, x, y, GHOST_SPEED, GHOST_SPEED)  # uses Monster.__init__
+        self.sub_x, self.sub_y = 0, 0
+        self._heading = None
 
     def move(self, game: 'Game') -> None:
         """
-        Move the ghost on the <game>'s screen based on the player's location.
-        Check if the ghost has caught the player after each move.
+        Move the ghost on the <game>'s screen towards the player, along the
+        shortest way around the walls.
         """
 
-        if game.player.x > self.x:
-            self.x += self._dx * 0.25
-        elif game.player.x < self.x:
-            self.x -= self._dx * 0.25
-        elif game.player.y > self.y:
-            self.y += self._dy * 0.25
-        elif game.player.y < self.y:
-            self.y -= self._dy * 0.25
-
-        self.check_player_death(game)
+        if game.player is None:
+            return
+
+        # Pick the next tile to go to whenever the ghost reaches a tile, from
+        # the flow field the game keeps towards the player
+        on_tile = not self.sub_x and not self.sub_y
+        if self._heading is None or \
+                (on_tile and (self._x, self._y) == self._heading):
+            self._heading = None
+            if on_tile:
+                self._heading = game.get_flow_field().next_tile(self._x,
+                                                                self._y)
+        if self._heading is None:
+            return
+
+        # Work in steps of 1 / SUBTILE of a tile, and never step past the
+        # tile, so the ghost lines up with it exactly whatever the tick rate
+        # is
+        x, y = self.get_subtile_position()
+        to_x, to_y = self._heading[0] * SUBTILE, self._heading[1] * SUBTILE
+        step_x = max(1, round(self._dx * SUBTILE / game.get_tick_rate()))
+        step_y = max(1, round(self._dy * SUBTILE / game.get_tick_rate()))
+        if to_x > x:
+            x += min(step_x, to_x - x)
+        elif to_x < x:
+            x -= min(step_x, x - to_x)
+        elif to_y > y:
+            y += min(step_y, to_y - y)
+        elif to_y < y:
+            y -= min(step_y, y - to_y)
+
+        old_x, old_y, old_sub_x, old_sub_y = \
+            self._x, self._y, self.sub_x, self.sub_y
+        self._x, self.sub_x = divmod(x, SUBTILE)
+        self._y, self.sub_y = divmod(y, SUBTILE)
+        if self._index is not None:
+            self._index.relocate(self, old_x, old_y, old_sub_x, old_sub_y)
 
 
 class SquishyMonster(Monster):
     """
     A class to represent a monster in the game that can kill the player, or
     get squished by a box.
+
+    A squishy monster only steps once every _delay seconds, so it is
+    scheduled, and only moves on the ticks it steps on.
     """
     x: int
     y: int
     icon: pygame.Surface
+    scheduled: bool = True
     _dx: float
     _dy: float
-    _delay: int
+    _delay: float
     _delay_count: int
+    __slots__ = ()
 
     def __init__(self, icon_file: str, x: int, y: int) -> None:
         """Initalize a monster with the given <icon_file> and <x> and <y>
@@ -332,25 +540,42 @@ class SquishyMonster(Monster):
     def move(self, game: 'Game') -> None:
         """
         Move one step, if possible. If the way is blocked, bounce back in
-        the opposite direction. After each move, check if the player has been
-        hit.
+        the opposite direction. Then wait for the next step.
         """
 
-        if self._delay_count == 0:  # delay the monster's movement
-            if not (isinstance(game.get_actor(self.x + self._dx, self.y + self._dy), Wall) or isinstance(game.get_actor(self.x + self._dx, self.y + self._dy), Box)):
-                self.x += self._dx
-                self.y += self._dy
-            if (isinstance(game.get_actor(self.x + self._dx, self.y + self._dy), Wall) or isinstance(game.get_actor(self.x + self._dx, self.y + self._dy), Box)):
-                self._dx = -1 * self._dx
-                self._dy = -1 * self._dy
+        self.step(game)
+        game.schedule(self, game.ticks_for(self._delay))
+
+    def get_wait(self, game: 'Game') -> int:
+        """Return the number of ticks after the current one of the <game>
+        this monster next steps on: it steps on the tick that starts with
+        its delay count at 0, and the count goes up by one on each tick."""
+
+        return -self._delay_count % game.ticks_for(self._delay) + 1
+
+    def set_wait(self, game: 'Game', ticks: int) -> None:
+        """Set this monster's delay count to say that it next steps on the
+        tick <ticks> ticks after the current one of the <game>."""
 
-        self._delay_count = (self._delay_count + 1) % self._delay
+        self._delay_count = (1 - ticks) % game.ticks_for(self._delay)
 
-        self.check_player_death(game)
+    def step(self, game: 'Game') -> None:
+        """
+        Take one step diagonally, if the way is not blocked by a wall or a
+        box, and bounce back if the way on from there is blocked.
+        """
+
+        if game.get_kind(self.x + self._dx, self.y + self._dy) not in (WALL, BOX):
+            self.x += self._dx
+            self.y += self._dy
+        if game.get_kind(self.x + self._dx, self.y + self._dy) in (WALL, BOX):
+            self._dx = -1 * self._dx
+            self._dy = -1 * self._dy
 
     def die(self, game: 'Game') -> None:
         """Remove this monster from the <game>."""
         game.monster_count -= 1
+        game.monsters_squished += 1
         game.remove_actor(self)
 
 
@@ -364,25 +589,20 @@ class SquishyMonster2(SquishyMonster):
     icon: pygame.Surface
     _dx: float
     _dy: float
-    _delay: int
+    _delay: float
     _delay_count: int
+    __slots__ = ()
 
-    def move(self, game: 'Game') -> None:
+    def step(self, game: 'Game') -> None:
         """
-        Move one step horizontally, if possible. If the way is blocked, bounce back in
-        the opposite direction. After each move, check if the player has been
-        hit.
+        Take one step horizontally, if possible. If the way is blocked, bounce back in
+        the opposite direction.
         """
 
-        if self._delay_count == 0:
-            if not (isinstance(game.get_actor(self.x + self._dx, self.y), Wall) or isinstance(game.get_actor(self.x + self._dx, self.y), Box)):
-                self.x += self._dx
-            if (isinstance(game.get_actor(self.x + self._dx, self.y), Wall) or isinstance(game.get_actor(self.x + self._dx, self.y), Box)):
-                self._dx = -1 * self._dx
-
-        self._delay_count = (self._delay_count + 1) % self._delay
-
-        self.check_player_death(game)
+        if game.get_kind(self.x + self._dx, self.y) not in (WALL, BOX):
+            self.x += self._dx
+        if game.get_kind(self.x + self._dx, self.y) in (WALL, BOX):
+            self._dx = -1 * self._dx
 
 
 class SquishyMonster3(SquishyMonster):
@@ -395,26 +615,24 @@ class SquishyMonster3(SquishyMonster):
     icon: pygame.Surface
     _dx: float
     _dy: float
-    _delay: int
+    _delay: float
     _delay_count: int
+    __slots__ = ()
 
-    def move(self, game: 'Game') -> None:
+    def step(self, game: 'Game') -> None:
         """
-        Move one step vertically, if possible. If the way is blocked, bounce back in
-        the opposite direction. After each move, check if the player has been
-        hit.
+        Take one step vertically, if possible. If the way is blocked, bounce back in
+        the opposite direction. Unlike the other monsters, this one will not
+        step onto another monster.
         """
 
-        actor = game.get_actor(self.x, self.y + self._dy)
-        if self._delay_count == 0:
-            if not (isinstance(actor, Wall) or isinstance(actor, Box) or isinstance(actor, SquishyMonster)):
-                self.y += self._dy
-            if (isinstance(actor, Wall) or isinstance(actor, Box)):
-                self._dy = -1 * self._dy
-
-        self._delay_count = (self._delay_count + 1) % self._delay
-
-        self.check_player_death(game)
+        kind = game.get_kind(self.x, self.y + self._dy)
+        if kind not in (WALL, BOX) and not (
+                kind == MONSTER and
+                isinstance(game.get_actor(self.x, self.y + self._dy), SquishyMonster)):
+            self.y += self._dy
+        if kind in (WALL, BOX):
+            self._dy = -1 * self._dy
 
 
 class Door(Actor):
@@ -424,6 +642,9 @@ class Door(Actor):
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = DOOR
+    idle: bool = True
+    __slots__ = ()
 
     def move(self, game: 'Game') -> None:
         """
@@ -440,6 +661,9 @@ class Key(Actor):
     x: int
     y: int
     icon: pygame.Surface
+    kind: int = KEY
+    idle: bool = True
+    __slots__ = ()
 
     def move(self, game: 'Game') -> None:
         """
@@ -447,3 +671,31 @@ class Key(Actor):
         """
 
         pass
+
+
+# The classes of actor a game snapshot can hold, numbered by their place in
+# this tuple; new classes must be added at the end, so that the numbers of
+# snapshots already saved stay the same
+ACTOR_CLASSES = (Player, Star, Wall, Box, GhostMonster, SquishyMonster,
+                 SquishyMonster2, SquishyMonster3, Door, Key)
+
+
+# === Static tiles === #
+# Walls and doors never move or leave the stage, so a level stores them as
+# tile kinds (see settings) in its spatial index, and only makes an actor for
+# one when it is looked up.
+
+# The class and image of each kind of static tile
+STATIC_TILES = {
+    WALL: (Wall, "../images/wall-24.png"),
+    DOOR: (Door, "../images/door-24.png"),
+}
+
+
+def make_static_actor(tile: int, x: int, y: int) -> Actor:
+    """
+    Return an actor for a static tile of the kind <tile> at <x> and <y>.
+    """
+
+    actor_class, icon_file = STATIC_TILES[tile]
+    return actor_class(icon_file, x, y)
@@ -0,0 +1,102 @@
+"""
+This module contains the asset cache that lets every actor share a single
+copy of each image in the game.
+"""
+
+from __future__ import annotations
+from typing import Dict, Iterable
+import pygame
+
+
+class AssetCache:
+    """
+    A registry of the images used by the game. Each image file is loaded from
+    disk only once, and is converted to the display's pixel format once a
+    display exists so that blitting it does not need a conversion every frame.
+
+    === Private Attributes ===
+    _icons:
+        map from an image file to the Surface loaded from it
+    _converted:
+        true iff the cached Surfaces have been converted to the display's
+        pixel format
+    _preloaded:
+        map from an image file to the Surface loaded from it ahead of time,
+        not yet converted or handed out
+    """
+    _icons: Dict[str, pygame.Surface]
+    _converted: bool
+    _preloaded: Dict[str, pygame.Surface]
+
+    def __init__(self) -> None:
+        """
+        Initialize an empty asset cache.
+        """
+
+        self._icons = {}
+        self._converted = False
+        self._preloaded = {}
+
+    def get_icon(self, icon_file: str) -> pygame.Surface:
+        """
+        Return the Surface for the image <icon_file>, loading it on first use.
+        """
+
+        icon = self._icons.get(icon_file)
+        if icon is None:
+            icon = self._preloaded.pop(icon_file, None)
+            if icon is None:
+                icon = pygame.image.load(icon_file)
+            if self._converted:
+                icon = self._convert(icon)
+            self._icons[icon_file] = icon
+        return icon
+
+    def preload(self, icon_files: Iterable[str]) -> None:
+        """
+        Load the images <icon_files> that have not been loaded yet, so that
+        get_icon does not have to read them from disk.
+
+        This may be called from a background thread, as it only loads the
+        images; get_icon converts them when they are first used.
+        """
+
+        for icon_file in icon_files:
+            if icon_file not in self._icons and \
+                    icon_file not in self._preloaded:
+                self._preloaded[icon_file] = pygame.image.load(icon_file)
+
+    def convert_all(self) -> None:
+        """
+        Convert every cached image to the display's pixel format. Images
+        loaded after this is called are converted as they are loaded.
+
+        This must only be called once a display has been set up.
+        """
+
+        for icon_file, icon in self._icons.items():
+            self._icons[icon_file] = self._convert(icon)
+        self._converted = True
+
+    def clear(self) -> None:
+        """
+        Forget every cached image, e.g. after the display has been closed.
+        """
+
+        self._icons = {}
+        self._converted = False
+        self._preloaded = {}
+
+    def _convert(self, icon: pygame.Surface) -> pygame.Surface:
+        """
+        Return a copy of <icon> in the display's pixel format, keeping its
+        transparency if it has any.
+        """
+
+        if icon.get_flags() & pygame.SRCALPHA:
+            return icon.convert_alpha()
+        return icon.convert()
+
+
+# The asset cache shared by every actor in the game
+ASSETS = AssetCache()
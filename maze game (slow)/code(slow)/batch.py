@@ -0,0 +1,267 @@
+"""
+This module runs many independent games headless across a pool of worker
+processes, e.g. to try input scripts, bots or random seeds against the
+levels in LEVEL_MAPS.
+
+Each job gives a starting level, a random seed and an input script, and
+each run gives back a small result. For example:
+    jobs = [Job(level, seed, random_script(seed, 1000))
+            for level in range(3) for seed in range(100)]
+    results = run_batch(jobs)
+
+It can also be run from this directory to try random input scripts, e.g.:
+    python batch.py --levels 0 1 2 --seeds 100 --ticks 1000
+"""
+
+from __future__ import annotations
+import os
+
+# Keep pygame's greeting out of the results written to stdout. This must be
+# set before pygame is imported.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Union
+from game2 import Game, LEVEL_MAPS, load_map
+from inputs import ScriptedInput, NOOP, DOWN
+from levelfile import LevelData, parse_map, load_level, LEVEL_FILE_SUFFIX
+from mazegen import MazeSpec
+
+
+class Job:
+    """
+    A game to run headless.
+
+    === Public Attributes ===
+    level:
+        the level the game starts at
+    seed:
+        the seed of the random numbers used to place the level's actors
+    actions:
+        the action (see inputs) taken on each tick
+    max_ticks:
+        the most ticks to run, or None to run until the actions run out
+    level_maps:
+        the map of each level, or None for LEVEL_MAPS
+    batch_monsters:
+        whether the game moves its squishy monsters in a swarm
+    """
+    level: int
+    seed: int
+    actions: Sequence[int]
+    max_ticks: Optional[int]
+    level_maps: Optional[List]
+    batch_monsters: bool
+
+    def __init__(self, level: int, seed: int, actions: Sequence[int],
+                 max_ticks: Optional[int] = None,
+                 level_maps: Optional[List] = None,
+                 batch_monsters: bool = False) -> None:
+        """
+        Initialize a job that plays the <actions> on a game started at
+        <level> with the given <seed>.
+        """
+
+        self.level = level
+        self.seed = seed
+        self.actions = actions
+        self.max_ticks = max_ticks
+        self.level_maps = level_maps
+        self.batch_monsters = batch_monsters
+
+    def __repr__(self) -> str:
+        """
+        Return a string representation of this job.
+        """
+
+        return "Job(level={}, seed={}, {} actions)".format(
+            self.level, self.seed, len(self.actions))
+
+
+class RunResult:
+    """
+    The result of running a job.
+
+    === Public Attributes ===
+    outcome:
+        "won" or "lost" if the game ended that way, or None if it ran out of
+        ticks
+    ticks:
+        the number of ticks that were run
+    level:
+        the level the game was on when it stopped
+    stars:
+        the number of stars the player collected, on every level played
+    monsters_squished:
+        the number of monsters squished with boxes
+    """
+    outcome: Optional[str]
+    ticks: int
+    level: int
+    stars: int
+    monsters_squished: int
+
+    def __init__(self, outcome: Optional[str], ticks: int, level: int,
+                 stars: int, monsters_squished: int) -> None:
+        """
+        Initialize the result of a run.
+        """
+
+        self.outcome = outcome
+        self.ticks = ticks
+        self.level = level
+        self.stars = stars
+        self.monsters_squished = monsters_squished
+
+    def __repr__(self) -> str:
+        """
+        Return a string representation of this result.
+        """
+
+        return "RunResult({!r}, ticks={}, level={}, stars={}, squished={})" \
+            .format(self.outcome, self.ticks, self.level, self.stars,
+                    self.monsters_squished)
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Return True iff <other> is the same result.
+        """
+
+        return isinstance(other, RunResult) and \
+            self.to_dict() == other.to_dict()
+
+    def to_dict(self) -> Dict:
+        """
+        Return this result as a dictionary that can be written as JSON.
+        """
+
+        return {"outcome": self.outcome, "ticks": self.ticks,
+                "level": self.level, "stars": self.stars,
+                "monsters_squished": self.monsters_squished}
+
+
+# The level data of each map file a worker has loaded, so the files are
+# read and parsed once per worker rather than once per job. A worker's
+# images are cached by assets.ASSETS in the same way, though headless games
+# never load them.
+_LEVELS: Dict[str, LevelData] = {}
+
+
+def run_job(job: Job) -> RunResult:
+    """
+    Run the <job> headless in this process, and return its result.
+    """
+
+    level_maps = [_cached_level(level_map) for level_map in
+                  (job.level_maps if job.level_maps is not None else LEVEL_MAPS)]
+    game = Game(headless=True, level=job.level, level_maps=level_maps,
+                input_source=ScriptedInput(job.actions),
+                batch_monsters=job.batch_monsters, seed=job.seed)
+    max_ticks = job.max_ticks if job.max_ticks is not None else len(job.actions)
+    ticks = game.run_headless(max_ticks)
+    return RunResult(game.get_outcome(), ticks, game.get_level(),
+                     game.stars_collected, game.monsters_squished)
+
+
+def run_batch(jobs: Sequence[Job], processes: Optional[int] = None,
+              chunksize: Optional[int] = None) -> List[RunResult]:
+    """
+    Run the <jobs> across a pool of <processes> worker processes (by
+    default one per CPU), and return their results in the same order.
+
+    Each job's result depends only on the job, so it is the same as running
+    it with run_job in this process.
+    """
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes <= 1 or len(jobs) <= 1:
+        return [run_job(job) for job in jobs]
+
+    # Hand out a few chunks of jobs per worker, so workers are kept busy
+    # without a round trip to the pool for every job
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (processes * 4))
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(run_job, jobs, chunksize)
+
+
+def random_script(seed: int, length: int) -> List[int]:
+    """
+    Return a script of <length> random actions made from <seed>.
+    """
+
+    rng = random.Random(seed)
+    return [rng.randint(NOOP, DOWN) for _ in range(length)]
+
+
+def _cached_level(level_map: Union[str, MazeSpec, LevelData]
+                  ) -> Union[MazeSpec, LevelData]:
+    """
+    Return the level data of <level_map> if it names a map file, loading it
+    the first time this worker sees it, or <level_map> itself otherwise.
+    """
+
+    if not isinstance(level_map, str):
+        return level_map
+    level = _LEVELS.get(level_map)
+    if level is None:
+        if level_map.endswith(LEVEL_FILE_SUFFIX):
+            level = load_level("../data/" + level_map)
+        else:
+            level = parse_map(load_map("../data/" + level_map))
+            # Shared by every job this worker runs, so make it read-only
+            level.tiles = bytes(level.tiles)
+        _LEVELS[level_map] = level
+    return level
+
+
+def main() -> None:
+    """
+    Run random input scripts on the levels given on the command line, and
+    write the results as JSON.
+    """
+
+    parser = argparse.ArgumentParser(description="Run many games headless.")
+    parser.add_argument("--levels", type=int, nargs="*", default=[0, 1, 2])
+    parser.add_argument("--seeds", type=int, default=100,
+                        help="the number of seeds to run each level with")
+    parser.add_argument("--ticks", type=int, default=1000,
+                        help="the most ticks to run each game for")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="the number of worker processes (default: one "
+                             "per CPU)")
+    parser.add_argument("--batch-monsters", action="store_true",
+                        help="move squishy monsters in a swarm (needs NumPy)")
+    parser.add_argument("--output", default="-",
+                        help="file to write the JSON results to (- for stdout)")
+    args = parser.parse_args()
+
+    jobs = [Job(level, seed, random_script(seed, args.ticks),
+                batch_monsters=args.batch_monsters)
+            for level in args.levels for seed in range(args.seeds)]
+    start = time.perf_counter()
+    results = run_batch(jobs, args.processes)
+    elapsed = time.perf_counter() - start
+
+    report = {
+        "jobs": len(jobs),
+        "seconds": round(elapsed, 3),
+        "results": [dict({"start_level": job.level, "seed": job.seed},
+                         **result.to_dict())
+                    for job, result in zip(jobs, results)],
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+This module measures how fast the game runs, and writes the results as JSON
+so that runs can be compared to catch performance regressions.
+
+It measures simulation ticks per second (Game.on_loop), frames per second
+(Game.on_render, drawn to an offscreen display), level setup latency
+(Game.setup_current_level) and the cost of Game.get_actor, on the shipped
+maps, on synthetic maps of growing size, and on procedurally generated mazes.
+On the mazes, it also measures how long the ghost's flow field takes to find
+its way each time the player steps to another tile.
+
+Run it from this directory, e.g.:
+    python benchmark.py --output bench.json --sizes 20 40 80 160
+"""
+
+from __future__ import annotations
+import os
+
+# Render to an offscreen display, and keep pygame's greeting out of the JSON
+# written to stdout. These must be set before pygame is imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import contextlib
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+from typing import Callable, Dict, List
+import pygame
+from actors2 import GhostMonster
+from game2 import Game, LEVEL_MAPS
+from inputs import ScriptedInput
+from levelfile import parse_map
+from mazegen import MazeSpec
+from settings import WALL
+
+# The levels synthetic maps are made for
+SYNTHETIC_LEVELS = (0, 1, 2)
+
+
+def synthetic_map(size: int, level: int, seed: int) -> List[List[str]]:
+    """
+    Return map data for a random <size> x <size> map for the given <level>,
+    in the same format as load_map. Walls fill the border and about a fifth
+    of the inside, and monsters grow with the map's area.
+    """
+
+    rng = random.Random(seed)
+    data = [['O'] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(size):
+            if i in (0, size - 1) or j in (0, size - 1) or rng.random() < 0.2:
+                data[i][j] = 'X'
+
+    data[1][1] = 'P'
+    data[size // 2][size - 1] = 'D'
+    if level == 0:
+        data[size - 2][size - 2] = 'C'
+        return data
+
+    monsters = ['M'] if level == 1 else ['M', 'N']
+    for _ in range(max(1, size * size // 100)):
+        i, j = rng.randrange(2, size - 1), rng.randrange(2, size - 1)
+        if data[i][j] == 'O':
+            data[i][j] = rng.choice(monsters)
+    if level == 2:
+        data[size - 2][1] = 'K'
+    return data
+
+
+class Benchmark:
+    """
+    A class that runs each measurement for a minimum amount of time and
+    collects the results.
+
+    === Public Attributes ===
+    min_time:
+        the least number of seconds each measurement runs for
+    seed:
+        the seed used for random placement, maps and input
+    batch_monsters:
+        whether the games measured move their squishy monsters in a swarm
+    results:
+        the result of each measurement taken so far
+    """
+    min_time: float
+    seed: int
+    batch_monsters: bool
+    results: List[Dict]
+
+    def __init__(self, min_time: float, seed: int,
+                 batch_monsters: bool = False) -> None:
+        """
+        Initialize a benchmark whose measurements each run for at least
+        <min_time> seconds, using the given <seed>, on games that batch their
+        monsters iff <batch_monsters> is True.
+        """
+
+        self.min_time = min_time
+        self.seed = seed
+        self.batch_monsters = batch_monsters
+        self.results = []
+
+    def new_game(self, level: int, data: List[List[str]] = None,
+                 headless: bool = True) -> Game:
+        """
+        Return a new game at the given <level>, using the map <data> if
+        given, or the level's map from LEVEL_MAPS otherwise. The game never
+        sets up its next level in the background, so no other thread runs
+        while it is timed.
+        """
+
+        level_maps = list(LEVEL_MAPS)
+        if data is not None:
+            level_maps[level] = parse_map(data)
+        rng = random.Random(self.seed)
+        return Game(headless=headless, level=level, level_maps=level_maps,
+                    batch_monsters=self.batch_monsters, seed=self.seed,
+                    prefetch=False,
+                    input_source=ScriptedInput(
+                        rng.randrange(5) for _ in itertools.count()))
+
+    def run_all(self, sizes: List[int], maze_sizes: List[int]) -> None:
+        """
+        Take every measurement on the shipped maps, then on synthetic maps of
+        each of the given <sizes>, then on generated mazes of each of the
+        given <maze_sizes>.
+        """
+
+        for level, map_file in enumerate(LEVEL_MAPS):
+            self.measure_level(map_file, level, None)
+            self.measure_setup(map_file, level)
+
+        for size in sizes:
+            for level in SYNTHETIC_LEVELS:
+                data = synthetic_map(size, level, self.seed)
+                self.measure_level("synthetic-{}".format(size), level, data)
+
+        for size in maze_sizes:
+            for level in SYNTHETIC_LEVELS:
+                data = MazeSpec(size, size, self.seed).generate(level)
+                self.measure_level("maze-{}".format(size), level, data)
+                if level == 0:
+                    self.measure_chase("maze-{}".format(size), data)
+
+    def measure_level(self, map_name: str, level: int,
+                      data: List[List[str]] = None) -> None:
+        """
+        Measure ticks per second, frames per second and get_actor cost on the
+        given <level>, using the map <data> if given.
+        """
+
+        game = self.new_game(level, data)
+        actors = len(game.get_actors())
+        size = (game.stage_width, game.stage_height)
+
+        self._record("tick", map_name, level, size, actors,
+                     "ticks_per_second", self._measure_ticks(level, data))
+
+        rng = random.Random(self.seed)
+        points = [(rng.randrange(game.stage_width),
+                   rng.randrange(game.stage_height)) for _ in range(1000)]
+
+        def query() -> None:
+            for x, y in points:
+                game.get_actor(x, y)
+
+        self._record("get_actor", map_name, level, size, actors,
+                     "ns_per_query", 1e9 / (self._rate(query) * len(points)))
+
+        self._record("render", map_name, level, size, actors,
+                     "frames_per_second", self._measure_render(level, data))
+
+    def measure_chase(self, map_name: str, data: List[List[str]]) -> None:
+        """
+        Measure how long the flow field takes to find the ghost its way on
+        the level 0 map <data>, each time the player steps to another tile.
+        The player steps back and forth between where they start and a tile
+        next to it, and the ghost stays where it was placed.
+        """
+
+        game = self.new_game(0, data)
+        ghost = next(a for a in game.get_actors()
+                     if isinstance(a, GhostMonster))
+        field = game.get_flow_field()
+        index = game.get_spatial_index()
+        x, y = game.player.x, game.player.y
+        steps = [(x, y)] + [
+            tile for tile in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+            if 0 <= tile[0] < index.width and 0 <= tile[1] < index.height
+            and index.get_static(*tile) != WALL][:1]
+        tiles = itertools.cycle(steps)
+
+        def step() -> None:
+            field.set_target(*next(tiles))
+            field.next_tile(ghost.x, ghost.y)
+
+        self._record("chase", map_name, 0,
+                     (game.stage_width, game.stage_height),
+                     len(game.get_actors()), "us_per_step",
+                     1e6 / self._rate(step))
+
+    def measure_setup(self, map_name: str, level: int) -> None:
+        """
+        Measure how long Game.setup_current_level takes for <level>.
+        """
+
+        game = self.new_game(level)
+        rate = self._rate(game.setup_current_level)
+        self._record("setup", map_name, level,
+                     (game.stage_width, game.stage_height),
+                     len(game.get_actors()), "ms_per_setup", 1000 / rate)
+
+    def _measure_ticks(self, level: int, data: List[List[str]]) -> float:
+        """
+        Return the ticks per second on_loop manages on <level>. The game is
+        started again whenever it ends, which is not timed, so only the
+        ticks themselves are measured.
+        """
+
+        game = self.new_game(level, data)
+        game.on_init()
+        ticks, elapsed = 0, 0.0
+        while elapsed < self.min_time:
+            if not game.is_running():
+                game = self.new_game(level, data)
+                game.on_init()
+            start = time.perf_counter()
+            game.on_loop()
+            elapsed += time.perf_counter() - start
+            ticks += 1
+        return ticks / elapsed
+
+    def _measure_render(self, level: int, data: List[List[str]]) -> float:
+        """
+        Return the frames per second on_render manages on <level>, with the
+        simulation ticking between frames but not timed.
+        """
+
+        game = self.new_game(level, data, headless=False)
+        game.on_init()
+        frames, elapsed = 0, 0.0
+        while elapsed < self.min_time:
+            game.on_loop()
+            if not game.is_running():
+                game.on_cleanup()
+                game = self.new_game(level, data, headless=False)
+                game.on_init()
+            start = time.perf_counter()
+            game.on_render()
+            elapsed += time.perf_counter() - start
+            frames += 1
+        game.on_cleanup()
+        return frames / elapsed
+
+    def _rate(self, operation: Callable[[], None]) -> float:
+        """
+        Return how many times per second <operation> runs.
+        """
+
+        count, start = 0, time.perf_counter()
+        elapsed = 0.0
+        while elapsed < self.min_time:
+            operation()
+            count += 1
+            elapsed = time.perf_counter() - start
+        return count / elapsed
+
+    def _record(self, benchmark: str, map_name: str, level: int, size: tuple,
+                actors: int, metric: str, value: float) -> None:
+        """
+        Record the <value> of <metric> measured by <benchmark>.
+        """
+
+        result = {"benchmark": benchmark, "map": map_name, "level": level,
+                  "width": size[0], "height": size[1], "actors": actors,
+                  metric: round(value, 3)}
+        self.results.append(result)
+        print(json.dumps(result), file=sys.stderr)
+
+
+def main() -> None:
+    """
+    Run the benchmarks with the command line options, and write the results.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", default="-",
+                        help="file to write the JSON results to (- for stdout)")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[20, 40, 80, 160],
+                        help="widths of the synthetic square maps")
+    parser.add_argument("--maze-sizes", type=int, nargs="*", default=[100, 500],
+                        help="widths of the generated square mazes")
+    parser.add_argument("--min-time", type=float, default=0.5,
+                        help="seconds each measurement runs for at least")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-monsters", action="store_true",
+                        help="move squishy monsters in a swarm (needs NumPy)")
+    args = parser.parse_args()
+
+    # Keep the games' messages out of the JSON written to stdout
+    bench = Benchmark(args.min_time, args.seed, args.batch_monsters)
+    with contextlib.redirect_stdout(sys.stderr):
+        bench.run_all(args.sizes, args.maze_sizes)
+
+    report = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "min_time": args.min_time,
+        "seed": args.seed,
+        "batch_monsters": args.batch_monsters,
+        "results": bench.results,
+    }
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
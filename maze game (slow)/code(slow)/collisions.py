@@ -0,0 +1,178 @@
+"""
+This module contains the collision tracker, which finds the monsters that
+touch a player as they move, rather than having every monster look for the
+player after each of its moves.
+"""
+
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from settings import MONSTER, PLAYER, SUBTILE
+
+# The kinds of actor whose contacts are tracked
+_TRACKED = (PLAYER, MONSTER)
+
+# A contact between a player and a monster, in that order
+Contact = Tuple['Actor', 'Actor']
+
+
+class CollisionTracker:
+    """
+    The tiles the players and monsters of a level are in, kept up to date as
+    they are added, removed and moved, which finds the contacts between them.
+
+    An actor is in the tile its centre is in, so an actor between two tiles
+    (e.g. a ghost) is in the nearer one, and a player and a monster are in
+    contact when they are in the same tile. A contact is found when either of
+    them enters the tile, so only the actors that move cost any time, and a
+    player and a monster cannot pass through each other unseen.
+
+    An actor's move may set its x and y one after the other. Those changes
+    are taken together, as a single move, once another actor moves or the
+    tick ends, so an actor moving diagonally does not touch what is in the
+    tile it would pass on the way.
+
+    The spatial index of the level tells the tracker about every actor added,
+    removed and moved (see SpatialIndex.watch).
+
+    === Private Attributes ===
+    _tiles:
+        map from each player and monster in the level to the tile it is in
+    _occupants:
+        map from each tile a player or monster is in to the players and
+        monsters in it
+    _moving:
+        the actor whose move is being taken, which has not been checked for
+        contacts yet, or None
+    _contacts:
+        the contacts found in this tick, in the order they were found
+    """
+    _tiles: Dict['Actor', Tuple[int, int]]
+    _occupants: Dict[Tuple[int, int], List['Actor']]
+    _moving: Optional['Actor']
+    _contacts: List[Contact]
+
+    def __init__(self) -> None:
+        """
+        Initialize a tracker with no actors.
+        """
+
+        self._tiles = {}
+        self._occupants = {}
+        self._moving = None
+        self._contacts = []
+
+    def added(self, actor: 'Actor') -> None:
+        """
+        Start tracking the given <actor>, which has been added to the level,
+        if it is a player or a monster.
+        """
+
+        if actor.kind in _TRACKED:
+            self._settle()
+            self._enter(actor, _tile_of(actor))
+
+    def added_all(self, actors: Iterable['Actor']) -> None:
+        """
+        Start tracking each of the given <actors> that is a player or a
+        monster, the same as calling added for each of them.
+        """
+
+        self._settle()
+        for actor in actors:
+            if actor.kind in _TRACKED:
+                self._enter(actor, _tile_of(actor))
+
+    def removed(self, actor: 'Actor') -> None:
+        """
+        Stop tracking the given <actor>, which has been removed from the
+        level.
+        """
+
+        tile = self._tiles.pop(actor, None)
+        if tile is not None:
+            self._leave(actor, tile)
+            if actor is self._moving:
+                self._moving = None
+
+    def moved(self, actor: 'Actor') -> None:
+        """
+        Note that the given <actor> has moved.
+        """
+
+        if actor is not self._moving and actor.kind in _TRACKED:
+            self._settle()
+            self._moving = actor
+
+    def get_tiles(self) -> Dict['Actor', Tuple[int, int]]:
+        """
+        Return a map from each player and monster in the level to the tile
+        it is in. This is the tracker's own storage, not a copy.
+        """
+
+        self._settle()
+        return self._tiles
+
+    def end_tick(self, on_contacts: Callable[[List[Contact]], None]) -> None:
+        """
+        Finish a tick, calling <on_contacts> with the contacts found in it,
+        if there were any.
+        """
+
+        self._settle()
+        if self._contacts:
+            contacts, self._contacts = self._contacts, []
+            on_contacts(contacts)
+
+    def _settle(self) -> None:
+        """
+        Take the move of the actor that has been moving, checking the tile it
+        has ended up in for contacts.
+        """
+
+        actor = self._moving
+        if actor is None:
+            return
+        self._moving = None
+        tile = _tile_of(actor)
+        old_tile = self._tiles[actor]
+        if tile != old_tile:
+            self._leave(actor, old_tile)
+            self._enter(actor, tile)
+
+    def _enter(self, actor: 'Actor', tile: Tuple[int, int]) -> None:
+        """
+        Put the given <actor> in the <tile>, and record a contact with each
+        player or monster there that is not of its kind.
+        """
+
+        self._tiles[actor] = tile
+        occupants = self._occupants.get(tile)
+        if occupants is None:
+            self._occupants[tile] = [actor]
+            return
+        for other in occupants:
+            if other.kind != actor.kind:
+                self._contacts.append((actor, other) if actor.kind == PLAYER
+                                      else (other, actor))
+        occupants.append(actor)
+
+    def _leave(self, actor: 'Actor', tile: Tuple[int, int]) -> None:
+        """
+        Take the given <actor> out of the <tile>.
+        """
+
+        occupants = self._occupants[tile]
+        if len(occupants) == 1:
+            del self._occupants[tile]
+        else:
+            occupants.remove(actor)
+
+
+def _tile_of(actor: 'Actor') -> Tuple[int, int]:
+    """
+    Return the tile the centre of <actor> is in.
+    """
+
+    x, y = actor.get_subtile_position()
+    half = SUBTILE // 2
+    return (x + half) // SUBTILE, (y + half) // SUBTILE
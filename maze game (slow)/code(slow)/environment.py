@@ -0,0 +1,229 @@
+"""
+This module contains an environment that programs (e.g. bots being trained
+or evaluated) play the game through, in the style of a Gym environment:
+reset starts a game, and each step takes an action (see inputs) and runs one
+tick of it. For example:
+    env = MazeEnvironment()
+    observation = env.reset(level=0, seed=1)
+    done = False
+    while not done:
+        observation, reward, done, info = env.step(pick_action(observation))
+
+NumPy is only needed to play through an environment, so this module is
+only imported then.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from game2 import Game
+from inputs import ActionInput, NOOP
+from settings import MONSTER
+from spatial import SpatialIndex
+
+# The reward for each star collected, monster squished and key collected
+PROGRESS_REWARD = 1.0
+
+# The reward for going through the door to the next level, or winning
+LEVEL_REWARD = 10.0
+
+# The reward for losing the game
+LOSS_REWARD = -10.0
+
+
+class MazeEnvironment:
+    """
+    A game played headless, one tick at a time, by a program.
+
+    The observation is a NumPy array of the kind (see settings) of what is
+    in each tile of the stage, indexed by [y, x], as Game.get_kind returns
+    it. It is a read-only view of the spatial index's own storage rather
+    than a copy, so it is kept up to date by the game itself, and a step
+    costs no more than the tick it runs. A new array is only made when the
+    game goes to another level, so use the one the last step returned.
+
+    As with Game.get_kind, each tile shows the first actor added there: the
+    player standing on a door shows as the door, and an actor part way
+    between two tiles (a ghost on the move) is in neither until it reaches
+    one. The info of each step says where the player is, and the tile each
+    monster is in, counting one part way between tiles as in the tile its
+    centre is in (as the collision tracker does), so a ghost on the move can
+    still be seen.
+
+    Each step is rewarded PROGRESS_REWARD for each star collected, monster
+    squished and key collected in it, LEVEL_REWARD for going to the next
+    level or winning the game, and LOSS_REWARD for losing it. An episode is
+    done when the game is won or lost, or has run max_ticks ticks, and
+    cannot be stepped any further.
+
+    === Private Attributes ===
+    _level_maps:
+        the map of each level of the games played, or None for LEVEL_MAPS
+    _batch_monsters:
+        whether the games played move their squishy monsters in a swarm
+    _max_ticks:
+        the most ticks an episode runs, or None for no limit
+    _input:
+        the input source the game takes each action from
+    _game:
+        the game being played, or None before the first reset
+    _index:
+        the spatial index _observation is a view of, or None
+    _observation:
+        the view of the tiles of the level being played, or None
+    _progress:
+        the level the game is on, the stars the player has collected, the
+        monsters left and whether the key has been collected, as of the last
+        step
+    _ticks:
+        the number of ticks run in the episode
+    _done:
+        whether the episode is done, or there has not been one
+    """
+    _level_maps: Optional[List]
+    _batch_monsters: bool
+    _max_ticks: Optional[int]
+    _input: ActionInput
+    _game: Optional[Game]
+    _index: Optional[SpatialIndex]
+    _observation: Optional[np.ndarray]
+    _progress: Tuple[int, int, int, bool]
+    _ticks: int
+    _done: bool
+
+    def __init__(self, level_maps: Optional[List] = None,
+                 batch_monsters: bool = False,
+                 max_ticks: Optional[int] = None) -> None:
+        """
+        Initialize an environment that plays games of the maps in
+        <level_maps> (by default LEVEL_MAPS), moving squishy monsters in a
+        swarm if <batch_monsters> is True, for at most <max_ticks> ticks an
+        episode (no limit if it is None).
+        """
+
+        self._level_maps = level_maps
+        self._batch_monsters = batch_monsters
+        self._max_ticks = max_ticks
+        self._input = ActionInput()
+        self._game = None
+        self._index = None
+        self._observation = None
+        self._progress = (0, 0, 0, False)
+        self._ticks = 0
+        self._done = True
+
+    def get_game(self) -> Optional[Game]:
+        """
+        Return the game being played, or None before the first reset.
+        """
+
+        return self._game
+
+    def reset(self, level: int = 0, seed: Optional[int] = None) -> np.ndarray:
+        """
+        Start a new episode: a game at the given <level>, with its actors
+        placed with random numbers from <seed> (from the random module if it
+        is None). Return the first observation.
+        """
+
+        self._input.action = NOOP
+        self._game = Game(headless=True, input_source=self._input,
+                          level=level, level_maps=self._level_maps,
+                          batch_monsters=self._batch_monsters, seed=seed)
+        self._game.on_init()
+        self._ticks = 0
+        self._done = False
+        self._progress = self._get_progress()
+        return self._observe()
+
+    def step(self, action: int) -> Tuple[np.ndarray, float, bool, Dict]:
+        """
+        Take the given <action> for one tick of the game. Return the
+        observation after it, the reward for it, whether the episode is done
+        and a dictionary of information about the game.
+        """
+
+        game = self._game
+        if self._done:
+            raise ValueError("Cannot step an episode that has not been reset "
+                             "since it was done")
+
+        self._input.action = action
+        game.on_loop()
+        self._ticks += 1
+
+        progress = self._get_progress()
+        reward = self._reward(self._progress, progress, game.get_outcome())
+        self._progress = progress
+        self._done = not game.is_running() or \
+            (self._max_ticks is not None and self._ticks >= self._max_ticks)
+        return self._observe(), reward, self._done, self._get_info()
+
+    def _observe(self) -> np.ndarray:
+        """
+        Return the observation of the level being played, making a new view
+        if the game has gone to another level.
+        """
+
+        index = self._game.get_spatial_index()
+        if index is not self._index:
+            self._index = index
+            self._observation = np.frombuffer(
+                index.get_kinds(), dtype=np.uint8).reshape(index.height,
+                                                           index.width)
+            self._observation.flags.writeable = False
+        return self._observation
+
+    def _get_progress(self) -> Tuple[int, int, int, bool]:
+        """
+        Return the level the game is on, the stars the player has collected,
+        the monsters left and whether the key has been collected. The stars
+        stay as they were once the player has been caught.
+        """
+
+        game = self._game
+        player = game.player
+        stars = player.get_star_count() if player is not None \
+            else self._progress[1]
+        return (game.get_level(), stars, game.monster_count,
+                game.key_collected)
+
+    def _get_info(self) -> Dict:
+        """
+        Return a dictionary of information about the game.
+        """
+
+        game = self._game
+        player = game.player
+        level, stars, monsters, key = self._progress
+        tiles = game.get_collision_tracker().get_tiles()
+        return {"level": level,
+                "ticks": self._ticks,
+                "player": (player.x, player.y) if player is not None else None,
+                "stars": stars,
+                "goal_stars": game.goal_stars,
+                "monsters_left": monsters,
+                "monsters": [tile for actor, tile in tiles.items()
+                             if actor.kind == MONSTER],
+                "key_collected": key,
+                "outcome": game.get_outcome()}
+
+    @staticmethod
+    def _reward(old: Tuple[int, int, int, bool],
+                new: Tuple[int, int, int, bool],
+                outcome: Optional[str]) -> float:
+        """
+        Return the reward for a step that took the game from the progress
+        <old> to <new> (see _get_progress), and ended it with the given
+        <outcome> if it is not None.
+        """
+
+        if outcome == "lost":
+            return LOSS_REWARD
+        if outcome == "won" or new[0] != old[0]:
+            return LEVEL_REWARD
+
+        # The monsters left only go up when the next level is set up
+        progress = (new[1] - old[1]) + (old[2] - new[2]) + \
+            (1 if new[3] and not old[3] else 0)
+        return PROGRESS_REWARD * progress
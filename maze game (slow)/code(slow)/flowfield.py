@@ -0,0 +1,325 @@
+"""
+This module contains the flow field that monsters chasing the player follow
+through the maze.
+"""
+
+from __future__ import annotations
+from typing import Dict, KeysView, List, Optional, Tuple, Union
+from settings import WALL
+from spatial import SpatialIndex
+
+# The furthest, in steps, the search out from the target goes; chasers
+# further away than this follow the field of the whole stage instead
+SEARCH_RADIUS = 64
+
+# The number of tiles the search of the whole stage carries on by each time
+# a chaser further than SEARCH_RADIUS from the target asks the way
+STAGE_SEARCH_STEP = 2048
+
+
+class _Search:
+    """
+    A breadth-first search out from a tile of a stage, carried on one step
+    further from the tile at a time.
+
+    === Public Attributes ===
+    start:
+        the number of the tile searched out from (counting row by row), or
+        None if the search reaches nothing
+    distances:
+        map from the number of each tile reached so far (counting row by
+        row) to its distance from the tile searched out from
+    frontier:
+        the tiles reached so far that are furthest from the tile searched
+        out from, whose neighbours have not been searched yet
+    reached:
+        the distance of the tiles in frontier from the tile searched out
+        from
+
+    === Private Attributes ===
+    _static:
+        the kind of static tile at each tile of the stage, row by row; walls
+        cannot be walked through
+    _width:
+        the number of tiles across the stage
+    """
+    start: Optional[int]
+    distances: Dict[int, int]
+    frontier: List[int]
+    reached: int
+    _static: Union[bytearray, memoryview]
+    _width: int
+    __slots__ = ('start', 'distances', 'frontier', 'reached', '_static',
+                 '_width')
+
+    def __init__(self, static: Union[bytearray, memoryview], width: int,
+                 tile: Optional[int]) -> None:
+        """
+        Initialize a search of the stage with the given <static> tiles and
+        <width> out from the tile numbered <tile>, or a search that reaches
+        nothing if it is None.
+        """
+
+        self._static, self._width = static, width
+        self.start = tile
+        self.distances = {}
+        self.frontier = []
+        self.reached = 0
+        if tile is not None:
+            self.distances[tile] = 0
+            self.frontier.append(tile)
+
+    def search_further(self) -> None:
+        """
+        Reach every tile one step further from the tile searched out from
+        than the frontier.
+        """
+
+        width, static, distances = self._width, self._static, self.distances
+        last = len(static)
+        self.reached += 1
+        reached = self.reached
+        frontier = []
+        for tile in self.frontier:
+            column = tile % width
+            for neighbour in (tile - 1 if column > 0 else -1,
+                              tile + 1 if column < width - 1 else -1,
+                              tile - width, tile + width):
+                if 0 <= neighbour < last and neighbour not in distances \
+                        and static[neighbour] != WALL:
+                    distances[neighbour] = reached
+                    frontier.append(neighbour)
+        self.frontier = frontier
+
+    def search_tiles(self, count: int) -> None:
+        """
+        Carry on the search until at least <count> more tiles have been
+        reached, or every tile that can be has been.
+        """
+
+        goal = len(self.distances) + count
+        while self.frontier and len(self.distances) < goal:
+            self.search_further()
+
+    def finish(self) -> None:
+        """
+        Carry on the search until every tile that can be has been reached.
+        """
+
+        while self.frontier:
+            self.search_further()
+
+
+class FlowField:
+    """
+    The distance, in steps around the walls, from each tile of a stage to a
+    target tile, found by a breadth-first search out from the target.
+
+    One field is shared by every monster chasing the same target, so more
+    chasers cost nothing extra. The search is only started again when the
+    target changes tile, and only goes as far as it needs to: it stops at the
+    furthest tile that has been asked about, and carries on from there if a
+    tile further away is asked about later.
+
+    The search out from the target never goes further than SEARCH_RADIUS
+    steps, so following a target that moves costs the same however big the
+    stage is. Chasers further away than that follow a search of the whole
+    stage from where the target was a while before, which is carried on
+    STAGE_SEARCH_STEP tiles each time it is used and replaced with a search
+    from where the target is once it is finished. They head for where the
+    target was, and close in on the target once they are within
+    SEARCH_RADIUS steps of it. A chaser follows the newer search as soon as
+    it has reached the chaser's tile, and one that gets to where the target
+    was before then has the newer search carried on until it reaches the
+    chaser, so chasers never stand waiting for a search to finish.
+
+    === Public Attributes ===
+    width:
+        the number of tiles across the stage
+    height:
+        the number of tiles down the stage
+
+    === Private Attributes ===
+    _static:
+        the kind of static tile at each tile of the stage, row by row; walls
+        cannot be walked through
+    _target:
+        the target tile, or None if there is no target
+    _search:
+        the search out from the target, no further than SEARCH_RADIUS steps
+        unless the whole stage has been searched
+    _stage:
+        a finished search of the whole stage from where the target was, or
+        None if there has not been one
+    _next_stage:
+        the search of the whole stage that will replace _stage once it is
+        finished, or None if it has not been started
+    """
+    width: int
+    height: int
+    _static: Union[bytearray, memoryview]
+    _target: Optional[Tuple[int, int]]
+    _search: _Search
+    _stage: Optional[_Search]
+    _next_stage: Optional[_Search]
+
+    def __init__(self, index: SpatialIndex) -> None:
+        """
+        Initialize a field with no target over the stage of the spatial
+        <index>.
+        """
+
+        self.width, self.height = index.width, index.height
+        self._static = index.get_static_tiles()
+        self._target = None
+        self._search = _Search(self._static, self.width, None)
+        self._stage = None
+        self._next_stage = None
+
+    def set_target(self, x: int, y: int) -> None:
+        """
+        Make the tile at <x> and <y> the target, starting the search again
+        if it has changed.
+        """
+
+        if self._target == (x, y):
+            return
+        self._target = (x, y)
+        self._search = _Search(self._static, self.width, self._tile_of(x, y))
+
+    def get_state(self) -> tuple:
+        """
+        Return the tiles the searches of the whole stage were started from,
+        and how far the one not yet finished has got, which set_state can
+        return a field to. The search out from the target is left out, as
+        it finds the same way however far it had got.
+        """
+
+        stage, next_stage = self._stage, self._next_stage
+        if next_stage is None:
+            return (stage.start if stage is not None else None, None, 0)
+        return (stage.start, next_stage.start, next_stage.reached)
+
+    def set_state(self, state: tuple) -> None:
+        """
+        Return the searches of the whole stage to the given <state>, as
+        returned by get_state, searching the stage again as far as they had
+        got.
+        """
+
+        stage, next_stage, reached = state
+        self._stage, self._next_stage = None, None
+        if stage is not None:
+            self._stage = _Search(self._static, self.width, stage)
+            self._stage.finish()
+        if next_stage is not None:
+            self._next_stage = _Search(self._static, self.width, next_stage)
+            while self._next_stage.reached < reached:
+                self._next_stage.search_further()
+
+    def next_tile(self, x: int, y: int) -> Optional[Tuple[int, int]]:
+        """
+        Return the neighbour of the tile at <x> and <y> to step to on a
+        shortest way to the target, or None if the tile is the target or the
+        target cannot be reached from it.
+
+        A tile further than SEARCH_RADIUS steps from the target steps towards
+        where the target was when the newest search of the whole stage that
+        has reached the tile was started.
+        """
+
+        tile = self._tile_of(x, y)
+        if tile is None:
+            return None
+
+        # The search of the whole stage is used as it is if it was started
+        # from the target, however far the search out from it has got
+        search = self._search
+        if self._stage is not None and self._stage.start == search.start:
+            search = self._stage
+        while tile not in search.distances and search.frontier and \
+                search.reached < SEARCH_RADIUS:
+            search.search_further()
+        if tile not in search.distances and search.frontier:
+            search = self._stage_search(tile)
+
+        distance = search.distances.get(tile)
+        if not distance:
+            return None
+
+        # Every tile one step nearer has been reached by now
+        for next_x, next_y in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if 0 <= next_x < self.width and 0 <= next_y < self.height:
+                if search.distances.get(next_y * self.width + next_x) == \
+                        distance - 1:
+                    return next_x, next_y
+        return None
+
+    def reachable_tiles(self) -> KeysView[int]:
+        """
+        Return the number (counting row by row) of every tile the target can
+        be reached from, searching the rest of the stage to find them all.
+        """
+
+        self._search.finish()
+        self._stage, self._next_stage = self._search, None
+        return self._search.distances.keys()
+
+    def _stage_search(self, tile: int) -> _Search:
+        """
+        Carry on the search of the whole stage, and return the newest search
+        of it that leads on from the tile numbered <tile>, or shows that the
+        target cannot be reached from it. If no search has been finished,
+        the one started is finished first.
+        """
+
+        next_stage = self._next_stage
+        if next_stage is None:
+            next_stage = self._start_stage_search()
+        if self._stage is None:
+            next_stage.finish()
+        else:
+            next_stage.search_tiles(STAGE_SEARCH_STEP)
+        if not next_stage.frontier:
+            self._stage, self._next_stage = next_stage, None
+
+        # Every tile the search not yet finished has reached is already at
+        # its final distance from where that search started
+        for search in (self._next_stage, self._stage):
+            if search is not None and search.distances.get(tile):
+                return search
+        if tile not in self._stage.distances:
+            return self._stage
+
+        # The tile is where the target was when the finished search was
+        # started, so rather than wait there, the newer search is carried on
+        # until it reaches the tile, or started again from the target if it
+        # was started from the tile too
+        next_stage = self._next_stage
+        if next_stage is None or next_stage.start == tile:
+            next_stage = self._start_stage_search()
+        while tile not in next_stage.distances and next_stage.frontier:
+            next_stage.search_further()
+        if not next_stage.frontier:
+            self._stage, self._next_stage = next_stage, None
+        return next_stage
+
+    def _start_stage_search(self) -> _Search:
+        """
+        Start a search of the whole stage from the target, to replace the
+        last one finished once it is finished itself, and return it.
+        """
+
+        self._next_stage = _Search(self._static, self.width,
+                                   self._tile_of(*self._target))
+        return self._next_stage
+
+    def _tile_of(self, x: int, y: int) -> Optional[int]:
+        """
+        Return the number (counting row by row) of the tile at <x> and <y>,
+        or None if it is not on the stage.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return None
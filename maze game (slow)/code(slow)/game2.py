@@ -1,11 +1,56 @@
 from __future__ import annotations
-from typing import Optional, List
+from typing import Optional, List, Tuple
 from actors2 import *
+from spatial import SpatialIndex
+from registry import ActorRegistry
+from collisions import CollisionTracker, Contact
+from flowfield import FlowField
+from assets import ASSETS
+from renderer import Renderer
+from inputs import InputSource, KeyboardInput
+from mazegen import MazeSpec
+from levelfile import LevelData, parse_map, load_level, LEVEL_FILE_SUFFIX
+from prefetch import LevelPrefetch
+from profiler import FrameProfiler
+import contextlib
+import copy
+import marshal
 import pygame
 import random
+import struct
+from operator import attrgetter
 
+# The map of each level: the name of a map file or compiled level file in
+# data/, a MazeSpec for a procedurally generated maze, or the LevelData of a
+# map that has already been loaded
 LEVEL_MAPS = ["maze1.txt", "maze3.txt", "final_maze.txt"]
 
+# The attributes of a game that setting up a level sets, which are swapped
+# in from a copy of the game the next level was set up in
+_LEVEL_ATTRIBUTES = ("_level", "_level_data", "_registry", "_swarm", "_index",
+                     "_collisions", "_flow_field", "stage_width",
+                     "stage_height", "size", "player", "goal_message",
+                     "goal_stars")
+
+# The context manager used for the sections of an unprofiled game's frames
+_UNTIMED = contextlib.nullcontext()
+
+# The lookups a profiled game counts in each tick
+_COUNTED_LOOKUPS = ("get_actor", "get_kind")
+
+# The version of the format of Game.snapshot, which restore checks. Version 1
+# held the position of a ghost part way between tiles as a fraction, version
+# 2 did not hold the state of the flow field, and version 3 did not hold the
+# stars collected on every level.
+SNAPSHOT_VERSION = 4
+
+# The number a snapshot writes for each class of actor, and a function that
+# returns the values of an actor of the class's state fields (the same as
+# get_state, without a method call and a loop per actor)
+_SNAPSHOT_CLASSES = {
+    actor_class: (i, attrgetter(*actor_class._state_fields))
+    for i, actor_class in enumerate(ACTOR_CLASSES)}
+
 
 def load_map(filename: str) -> List[List[str]]:
     """
@@ -31,13 +76,35 @@ class Game:
     goal_message: the objective of this game that the player needs to achieve to win
     goal_stars: the number of stars the player needs to collect to win the game
     monster_count: the number of monsters that has been added to this game
+    monsters_squished: the number of monsters squished with boxes in this game
+    stars_collected: the number of stars the player has collected on every level of this game
     key_collected: true iff the player has collected the key in level 2 of this game
 
     === Private Attributes ===
     _running: true when the game is running
     _level: the level of this game the player is currently on
+    _level_maps: the map of each level of this game
+    _level_data: the level data of the current level's map
+    _random: the random numbers used to place actors when a level is set up
+    _random_state: the state of _random packed for a snapshot, kept while a level runs
+        (as the level does not use _random), or None if it has not been packed yet
     _max_level: the maxium level of this game
-    _actors: the actors in this game
+    _registry: the actors in this game, and the order the ones that move are moved in
+    _index: the spatial index used to look up the actors in this game by position
+    _collisions: the collision tracker finding the monsters that touch the player
+    _flow_field: the flow field towards the player shared by the monsters chasing them,
+        or None if none has been needed on this level yet
+    _renderer: the renderer that draws this game onto the screen
+    _tick_rate: the number of simulation ticks this game runs per second
+    _render_rate: the most frames this game renders per second, or 0 for no limit
+    _headless: true iff this game runs without a display, rendering or sleeping
+    _input: the source of the keys pressed on each tick
+    _outcome: "won" or "lost" once the game has ended, otherwise None
+    _batch_monsters: true iff this game moves its squishy monsters together in a swarm
+    _swarm: the swarm moving the current level's squishy monsters, or None
+    _prefetch_levels: true iff this game sets up its next level in the background
+    _prefetch: the next level being set up in the background, or None
+    _profiler: the profiler timing each frame of this game, or None if it is not profiled
     """
     # Attribute types
     screen: pygame.Surface
@@ -49,26 +116,95 @@ class Game:
     goal_message: str
     goal_stars: int
     monster_count: int
+    monsters_squished: int
+    stars_collected: int
     key_collected: bool
     _running: bool
     _level: int
+    _level_maps: List
+    _level_data: Optional[LevelData]
+    _random: random.Random
+    _random_state: Optional[tuple]
     _max_level: int
-    _actors: Actor
-
-    def __init__(self) -> None:
-        """
-        Initialize a game that has a display screen and game actors.
+    _registry: ActorRegistry
+    _index: SpatialIndex
+    _collisions: CollisionTracker
+    _flow_field: Optional[FlowField]
+    _renderer: Renderer
+    _tick_rate: int
+    _render_rate: int
+    _headless: bool
+    _input: InputSource
+    _outcome: Optional[str]
+    _batch_monsters: bool
+    _swarm: Optional['SquishySwarm']
+    _prefetch_levels: bool
+    _prefetch: Optional[LevelPrefetch]
+    _profiler: Optional[FrameProfiler]
+
+    def __init__(self, tick_rate: int = TICK_RATE,
+                 render_rate: int = RENDER_RATE, headless: bool = False,
+                 input_source: Optional[InputSource] = None,
+                 level: int = 0, level_maps: Optional[List] = None,
+                 batch_monsters: bool = False,
+                 seed: Optional[int] = None,
+                 prefetch: Optional[bool] = None,
+                 profiler: Optional[FrameProfiler] = None) -> None:
+        """
+        Initialize a game that has a display screen and game actors, and
+        that runs <tick_rate> simulation ticks and at most <render_rate>
+        frames per second (no limit if <render_rate> is 0). The game starts
+        at the given <level>, and plays the maps in <level_maps> (by default
+        LEVEL_MAPS).
+
+        If <headless> is True, the game has no display and only runs its
+        simulation, as fast as possible. Keys are read from <input_source>,
+        or from the keyboard if it is None.
+
+        If <batch_monsters> is True, the squishy monsters of each level are
+        moved together with NumPy arrays (see swarm.py), which gives the same
+        results as moving them one at a time, much faster on levels with many
+        monsters. This needs NumPy to be installed.
+
+        Actors are placed with random numbers from the given <seed>, so that
+        the same seed and input always play out the same way, or from the
+        random module if <seed> is None.
+
+        If <prefetch> is True, each next level is set up in a background
+        thread while the current one is played, so that going through the
+        door only has to swap it in. By default only games with a display
+        do this, as a headless game has no time between ticks to spare.
+
+        If a <profiler> is given, it times each frame of the game, and F3
+        shows or hides its overlay.
         """
 
         self._running = False
-        self._level = 0
-        self._max_level = len(LEVEL_MAPS) - 1
+        self._tick_rate = tick_rate
+        self._render_rate = render_rate
+        self._headless = headless
+        self._input = input_source if input_source is not None else KeyboardInput()
+        self._outcome = None
+        self._batch_monsters = batch_monsters
+        self._level = level
+        self._level_maps = level_maps if level_maps is not None else LEVEL_MAPS
+        self._level_data = None
+        self._random = random.Random(seed) if seed is not None else random
+        self._random_state = None
+        self._max_level = len(self._level_maps) - 1
+        self._prefetch_levels = prefetch if prefetch is not None else not headless
+        self._prefetch = None
         self.screen = None
+        self._renderer = None
         self.player = None
         self.keys_pressed = None
 
         # Attributes that get set during level setup
-        self._actors = None
+        self._registry = None
+        self._index = None
+        self._collisions = None
+        self._flow_field = None
+        self._swarm = None
         self.stage_width, self.stage_height = 0, 0
         self.size = None
         self.goal_message = None
@@ -76,11 +212,20 @@ class Game:
         # Attributes that are specific to certain levels
         self.goal_stars = 0
         self.monster_count = 0
+        self.monsters_squished = 0
+        self.stars_collected = 0
         self.key_collected = False
 
         # Method that takes care of level setup
         self.setup_current_level()
 
+        # A profiled game counts its lookups by wrapping its own methods, so
+        # a game that is not profiled pays nothing for the counting
+        self._profiler = profiler
+        if profiler is not None:
+            for name in _COUNTED_LOOKUPS:
+                setattr(self, name, profiler.counted(name, getattr(self, name)))
+
     def get_level(self) -> int:
         """
         Return the current level the game is at.
@@ -88,6 +233,54 @@ class Game:
 
         return self._level
 
+    def is_running(self) -> bool:
+        """
+        Return True iff the game is running.
+        """
+
+        return self._running
+
+    def get_outcome(self) -> Optional[str]:
+        """
+        Return "won" or "lost" if the game has ended that way, or None if it
+        has not ended.
+        """
+
+        return self._outcome
+
+    def get_tick_rate(self) -> int:
+        """
+        Return the number of simulation ticks the game runs per second.
+        """
+
+        return self._tick_rate
+
+    def ticks_for(self, seconds: float) -> int:
+        """
+        Return the number of simulation ticks, at least one, that take about
+        the given number of <seconds>.
+        """
+
+        return max(1, round(seconds * self._tick_rate))
+
+    def get_tick(self) -> int:
+        """
+        Return the number of ticks run on the current level, counting the one
+        being run.
+        """
+
+        return self._registry.get_tick()
+
+    def schedule(self, mover, ticks: int) -> None:
+        """
+        Move the given <mover>, a scheduled actor of the game (see
+        Actor.scheduled) or a thing that moves in the place of some, on the
+        tick <ticks> ticks after the current one (1 for the next tick). Until
+        then, it costs nothing on each tick.
+        """
+
+        self._registry.schedule(mover, ticks)
+
     def set_player(self, player: Player) -> None:
         """
         Set the game's player to be the given <player> object.
@@ -95,19 +288,80 @@ class Game:
 
         self.player = player
 
+    def get_actors(self) -> List[Actor]:
+        """
+        Return a new list of the game's actors, in the order they were added.
+        """
+
+        return self._registry.get_actors()
+
+    def get_spatial_index(self) -> SpatialIndex:
+        """
+        Return the spatial index of the game's current level.
+        """
+
+        return self._index
+
+    def get_collision_tracker(self) -> CollisionTracker:
+        """
+        Return the collision tracker of the game's current level.
+        """
+
+        return self._collisions
+
+    def get_flow_field(self) -> FlowField:
+        """
+        Return the flow field towards the player's tile on the current level,
+        shared by every monster chasing the player.
+        """
+
+        if self._flow_field is None:
+            self._flow_field = FlowField(self._index)
+        if self.player is not None:
+            self._flow_field.set_target(int(self.player.x), int(self.player.y))
+        return self._flow_field
+
+    def get_counters(self) -> List[Tuple[str, str]]:
+        """
+        Return the labels and values of the counters shown on the HUD for
+        the current level.
+        """
+
+        if self.player is None:
+            return []
+        if self._level == 0:
+            return [("Stars", "{}/{}".format(self.player.get_star_count(),
+                                             self.goal_stars))]
+        counters = [("Monsters left", str(self.monster_count))]
+        if self._level == 2:
+            counters.append(("Key", "yes" if self.key_collected else "no"))
+        return counters
+
     def add_actor(self, actor: Actor) -> None:
         """
         Add the given <actor> to the game's list of actors.
         """
 
-        self._actors.append(actor)
+        if self._swarm is not None:
+            self._disband_swarm()
+        self._registry.add(actor)
+        self._index.add(actor)
+        actor._index = self._index
+        if actor.scheduled:
+            self._registry.schedule(actor, actor.get_wait(self))
 
     def remove_actor(self, actor: Actor) -> None:
         """
-        Remove the given <actor> from the game's list of actors.
+        Remove the given <actor> from the game's list of actors. This may be
+        done while the actors move: an actor removed is not moved again, and
+        no other actor misses its move.
         """
 
-        self._actors.remove(actor)
+        if self._swarm is not None:
+            self._swarm.discard(actor)
+        self._registry.remove(actor)
+        self._index.remove(actor)
+        actor._index = None
 
     def get_actor(self, x: int, y: int) -> Optional[Actor]:
         """
@@ -115,18 +369,32 @@ class Game:
         <x> and <y>. If no actor exists in that location, return None.
         """
 
-        for actor in self._actors:
-            if actor.x == x:
-                if actor.y == y:
-                    return actor
+        return self._index.get(x, y)
+
+    def get_kind(self, x: int, y: int) -> int:
+        """
+        Return the kind (see settings) of the actor that get_actor returns
+        for <x> and <y>, or EMPTY if it returns None. This does not need to
+        find the actor.
+        """
+
+        return self._index.get_kind(x, y)
 
     def on_init(self) -> None:
         """
         Initialize the game's screen, and begin running the game.
+        A headless game has no screen.
         """
 
+        self._start_prefetch()
+        if self._headless:
+            self._running = True
+            return
+
         pygame.init()
         self.screen = pygame.display.set_mode(self.size, pygame.HWSURFACE | pygame.DOUBLEBUF)
+        ASSETS.convert_all()
+        self._renderer = Renderer(self.screen)
         self._running = True
 
     def on_event(self, event: pygame.Event) -> None:
@@ -136,9 +404,23 @@ class Game:
 
         if event.type == pygame.QUIT:
             self._running = False
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3 \
+                and self._profiler is not None:
+            self._profiler.overlay_visible = not self._profiler.overlay_visible
+            if not self._profiler.overlay_visible:
+                self._renderer.redraw()
         elif event.type == pygame.KEYDOWN:
             self.player.register_event(event.key)
 
+    def notify(self, message: str) -> None:
+        """
+        Show the player the given <message>. A headless game has no player
+        watching, so it shows nothing.
+        """
+
+        if not self._headless:
+            print(message)
+
     def game_won(self) -> bool:
         """
         Return True iff the game has been won, according to the current level.
@@ -146,7 +428,7 @@ class Game:
         if self._level == 0:
             if isinstance(self.get_actor(self.player.x, self.player.y), Door):
                 if not self.player._stars_collected >= self.goal_stars:
-                    print("Door won't open unless you collect enough stars")
+                    self.notify("Door won't open unless you collect enough stars")
                     self.player.x -= 1
                     return False
                 else:
@@ -154,7 +436,7 @@ class Game:
         if self._level == 1:
             if isinstance(self.get_actor(self.player.x, self.player.y), Door):
                 if not self.monster_count == 0:
-                    print("Door won't open unless all the monsters are dead")
+                    self.notify("Door won't open unless all the monsters are dead")
                     self.player.x -= 1
                     return False
                 else:
@@ -162,11 +444,11 @@ class Game:
         if self._level == 2:
             if isinstance(self.get_actor(self.player.x, self.player.y), Door):
                 if not self.monster_count == 0:
-                    print("Door won't open unless all the monsters are dead and you get the key")
+                    self.notify("Door won't open unless all the monsters are dead and you get the key")
                     self.player.x -= 1
                     return False
                 elif not self.key_collected:
-                    print("Door won't open unless all the monsters are dead and you get the key")
+                    self.notify("Door won't open unless all the monsters are dead and you get the key")
                     self.player.x -= 1
                     return False
                 else:
@@ -176,66 +458,213 @@ class Game:
         """
         Move all actors in the game as appropriate.
         Check for win/lose conditions and stop the game if necessary.
-        """
-        self.keys_pressed = pygame.key.get_pressed()
-        for actor in self._actors:
-            actor.move(self)
+        Only the actors whose move does something are moved.
+        """
+        self.keys_pressed = self._input.poll(self)
+        if self._renderer is not None:
+            # The renderer draws what moves in this tick part of the way
+            # along until the next one
+            self._index.start_motions()
+        registry = self._registry
+        if self._profiler is None:
+            for actor in registry.movers():
+                actor.move(self)
+        else:
+            self._profiler.move_actors(registry.movers(), self)
+        registry.end_tick()
+        self._collisions.end_tick(self._on_contacts)
 
         if isinstance(self.player, Actor):
-            if self.game_won():
+            with self._section("game_won"):
+                won = self.game_won()
+            if won:
                 if self._level == self._max_level:
-                    print("Congratlations, you won!")
+                    self.notify("Congratlations, you won!")
+                    self._outcome = "won"
                     self._running = False
                 elif isinstance(self.get_actor(self.player.x, self.player.y), Door):
-                    self._level += 1
-                    self.setup_current_level()
+                    self.go_to_level(self._level + 1)
 
         if isinstance(self.player, type(None)):
-            print("You lose! :( Better luck next time.")
+            self.notify("You lose! :( Better luck next time.")
+            self._outcome = "lost"
             self._running = False
 
-    def on_render(self) -> None:
+        if self._profiler is not None:
+            self._profiler.end_tick()
+
+    def on_render(self, alpha: float = 1.0) -> None:
         """
-        Render all the game's elements onto the screen.
+        Render all the game's elements onto the screen, with the actors that
+        moved in the last tick the fraction <alpha> of the way from where
+        they were to where they are.
         """
 
-        self.screen.fill(BLACK)
-        for a in self._actors:
-            rect = pygame.Rect(a.x * ICON_SIZE, a.y * ICON_SIZE, ICON_SIZE, ICON_SIZE)
-            self.screen.blit(a.icon, rect)
-
-        font = pygame.font.Font('freesansbold.ttf', 9)
-        text = font.render(self.goal_message, True, WHITE, BLACK)
-        textRect = text.get_rect()
-        textRect.center = (self.stage_width * ICON_SIZE // 2,
-                           (self.stage_height + 0.5) * ICON_SIZE)
-        self.screen.blit(text, textRect)
-
-        pygame.display.flip()
+        self._renderer.render(self, alpha)
+        if self._profiler is not None and self._profiler.overlay_visible:
+            pygame.display.update(self._profiler.draw_overlay(self.screen))
 
     def on_cleanup(self) -> None:
         """
         Clean up and close the game.
         """
 
-        pygame.quit()
+        if not self._headless:
+            pygame.quit()
+            ASSETS.clear()
 
     def on_execute(self) -> None:
         """
         Run the game until the game ends.
+
+        The simulation advances in fixed ticks of 1 / tick rate seconds of
+        real time, whatever the frame rate is. When a frame runs long, the
+        missed ticks are run back to back (up to MAX_CATCH_UP_TICKS) before
+        the next frame is rendered.
         """
 
+        if self._headless:
+            self.run_headless()
+            return
+
         self.on_init()
 
+        clock = pygame.time.Clock()
+        tick_time = 1000 / self._tick_rate
+        lag = 0.0
+
         while self._running:
-            pygame.time.wait(100)
-            for event in pygame.event.get():
-                self.on_event(event)
-            self.on_loop()
-            self.on_render()
+            lag += clock.tick(self._render_rate)
+            if self._profiler is not None:
+                self._profiler.begin_frame()
+            with self._section("on_event"):
+                for event in pygame.event.get():
+                    self.on_event(event)
+
+            ticks = 0
+            while self._running and lag >= tick_time:
+                with self._section("on_loop"):
+                    self.on_loop()
+                lag -= tick_time
+                ticks += 1
+                if ticks == MAX_CATCH_UP_TICKS:
+                    lag = 0.0
+
+            # Draw how far the game is through the time until the next tick
+            if self._running:
+                with self._section("on_render"):
+                    self.on_render(lag / tick_time)
+            if self._profiler is not None:
+                self._profiler.end_frame()
 
         self.on_cleanup()
 
+    def run_headless(self, max_ticks: Optional[int] = None) -> int:
+        """
+        Run the game's simulation without rendering or sleeping until the
+        game ends or <max_ticks> ticks have run. Return the number of ticks
+        that were run.
+
+        This may be called again to continue a game that was stopped by
+        <max_ticks>.
+        """
+
+        if not self._running and self._outcome is None:
+            self.on_init()
+
+        ticks = 0
+        while self._running and (max_ticks is None or ticks < max_ticks):
+            if self._profiler is None:
+                self.on_loop()
+            else:
+                # Each tick is a frame of its own
+                self._profiler.begin_frame()
+                with self._section("on_loop"):
+                    self.on_loop()
+                self._profiler.end_frame()
+            ticks += 1
+        return ticks
+
+    def snapshot(self) -> bytes:
+        """
+        Return the state of the game as it runs, packed into bytes, which
+        restore can return the game to. This holds the level the game is on
+        and the state of its actors, but not the level's map or the actors'
+        images, so it is small and quick enough to take every tick.
+        """
+
+        self._sync_waits()
+
+        # Each actor is written as the number of its class and of its image
+        # file, and the values of its state fields are written one after
+        # another for all the actors together
+        icon_files = {}
+        classes, icons, values = bytearray(), bytearray(), []
+        player = -1
+        for i, actor in enumerate(self._registry):
+            if actor is self.player:
+                player = i
+            number, get_state = _SNAPSHOT_CLASSES[type(actor)]
+            classes.append(number)
+            icons.append(icon_files.setdefault(actor._icon_file,
+                                               len(icon_files)))
+            values.extend(get_state(actor))
+
+        return marshal.dumps((
+            SNAPSHOT_VERSION, self._level, self._running, self._outcome,
+            self.goal_message, self.goal_stars, self.monster_count,
+            self.monsters_squished, self.stars_collected, self.key_collected,
+            self._pack_random_state(), player, tuple(icon_files), bytes(classes),
+            bytes(icons), tuple(values),
+            self._flow_field.get_state() if self._flow_field is not None
+            else None))
+
+    def restore(self, state: bytes) -> None:
+        """
+        Return the game to the given <state>, as returned by snapshot. The
+        level's map is only loaded again if the game is on another level.
+        """
+
+        state = marshal.loads(state)
+        if state[0] != SNAPSHOT_VERSION:
+            raise ValueError("Cannot restore a snapshot of version {}"
+                             .format(state[0]))
+        (_, level, self._running, self._outcome, self.goal_message,
+         self.goal_stars, self.monster_count, self.monsters_squished,
+         self.stars_collected, self.key_collected, random_state, player, icon_files, classes, icons,
+         values, flow_field) = state
+
+        data = self._level_data
+        if level != self._level or data is None:
+            data = self.load_level_map(level)
+        self._level = level
+        self.setup_stage(data)
+
+        actors, start = [], 0
+        for class_number, icon in zip(classes, icons):
+            actor_class = ACTOR_CLASSES[class_number]
+            end = start + len(actor_class._state_fields)
+            actors.append(actor_class.from_state(icon_files[icon],
+                                                 values[start:end]))
+            start = end
+        self._registry.add_all(actors)
+        self._index.add_all(actors)
+        for actor in actors:
+            actor._index = self._index
+            if actor.scheduled:
+                self._registry.schedule(actor, actor.get_wait(self))
+        self.set_player(actors[player] if player >= 0 else None)
+        if flow_field is not None:
+            self.get_flow_field().set_state(flow_field)
+        self._unpack_random_state(random_state)
+        self._gather_swarm()
+
+        # A level set up in the background from before is set up from other
+        # random numbers
+        self._prefetch = None
+        if self._running:
+            self._start_prefetch()
+
     def game_over(self) -> None:
         """
         Set the game as over (remove the player from the game).
@@ -243,14 +672,33 @@ class Game:
 
         self.player = None
 
+    def go_to_level(self, level: int) -> None:
+        """
+        Set up the given <level> and make it the current level, swapping in
+        the level set up in the background if it is that one.
+        """
+
+        prefetch, self._prefetch = self._prefetch, None
+        staged = prefetch.finish() if prefetch is not None and \
+            prefetch.level == level else None
+        if staged is None:
+            self._level = level
+            self.setup_current_level()
+        else:
+            for name in _LEVEL_ATTRIBUTES:
+                setattr(self, name, getattr(staged, name))
+            self.monster_count += staged.monster_count
+            self._random.setstate(staged._random.getstate())
+            self._random_state = None
+        self._start_prefetch()
+
     def setup_current_level(self):
         """
         Set up the current level of the game.
         """
 
-        data = load_map(
-            "../data/" + LEVEL_MAPS[self._level])  # Set the file where maze data is stored
-
+        data = self.load_level_map(self._level)
+        self._random_state = None
         if self._level == 0:
             self.setup_ghost_game(data)
         elif self._level == 1:
@@ -258,135 +706,309 @@ class Game:
         elif self._level == 2:
             self.setup_level2_game(data)
 
-    def setup_ghost_game(self, data) -> None:
+    def load_level_map(self, level: int):
         """
-        Set up a game with a ghost that chases the player, and stars to collect.
+        Return the map data of the given <level>, either as level data or in
+        the format returned by load_map.
+        """
+
+        level_map = self._level_maps[level]
+        if isinstance(level_map, LevelData):
+            return level_map
+        elif isinstance(level_map, MazeSpec):
+            return level_map.build(level)
+        elif level_map.endswith(LEVEL_FILE_SUFFIX):
+            return load_level("../data/" + level_map)
+        else:
+            return load_map(
+                "../data/" + level_map)  # Set the file where maze data is stored
+
+    def setup_stage(self, data) -> LevelData:
+        """
+        Set up a stage with the static tiles of the map <data>, which is
+        either level data or a map in the format returned by load_map, and a
+        window no bigger than MAX_VIEW_WIDTH x MAX_VIEW_HEIGHT tiles plus a
+        row for the HUD. Return the level data of the map.
         """
 
-        w = len(data[0])
-        h = len(
-            data) + 1
+        if not isinstance(data, LevelData):
+            data = parse_map(data)
+        w = data.width
+        h = data.height + 1
 
-        self._actors = []
+        self._registry = ActorRegistry()
+        self._swarm = None
+        self._index = SpatialIndex(w, h - 1, make_static_actor, data.tiles)
+        self._collisions = CollisionTracker()
+        self._index.watch(self._collisions)
+        self._flow_field = None
+        self._level_data = data
         self.stage_width, self.stage_height = w, h - 1
-        self.size = (w * ICON_SIZE, h * ICON_SIZE)
+        self.size = (min(w, MAX_VIEW_WIDTH) * ICON_SIZE,
+                     (min(h - 1, MAX_VIEW_HEIGHT) + 1) * ICON_SIZE)
+        return data
+
+    def place_actors(self, actor_class: type, icon_file: str, count: int,
+                     reachable: bool = False,
+                     away_from_walls: bool = False) -> int:
+        """
+        Add <count> new actors of <actor_class> with the image <icon_file>,
+        each at a different empty tile of the stage picked at random. Return
+        the number added, which is fewer than <count> only if there are not
+        enough empty tiles.
+
+        If <reachable> is True, only tiles the player can walk to around the
+        walls are picked. If <away_from_walls> is True, only tiles that are
+        not next to a wall or the edge of the stage are picked.
+        """
+
+        # The empty tiles are found once and picked from without
+        # replacement, so this takes the same time however crowded the
+        # stage is, rather than trying tiles until enough empty ones are hit
+        tiles = self._index.get_empty_tiles()
+        if reachable and self.player is not None:
+            reached = self.get_flow_field().reachable_tiles()
+            tiles = [tile for tile in tiles if tile in reached]
+        if away_from_walls:
+            tiles = [tile for tile in tiles if not self._next_to_wall(tile)]
+
+        width = self.stage_width
+        picked = self._random.sample(tiles, min(count, len(tiles)))
+        for tile in picked:
+            self.add_actor(actor_class(icon_file, tile % width, tile // width))
+        return len(picked)
+
+    def setup_ghost_game(self, data) -> None:
+        """
+        Set up a game with a ghost that chases the player, and stars to collect.
+        """
+
+        level = self.setup_stage(data)
 
         player, chaser = None, None
 
-        for i in range(len(data)):
-            for j in range(len(data[i])):
-                key = data[i][j]
-                if key == 'P':
-                    player = Player("../images/boy-24.png", j, i)
-                elif key == 'C':
-                    chaser = GhostMonster("../images/ghost-24.png", j, i)
-                elif key == 'X':
-                    self.add_actor(Wall("../images/wall-24.png", j, i))
-                elif key == 'D':
-                    self.add_actor(Door("../images/door-24.png", j, i))
+        for key, j, i in level.spawns:
+            if key == 'P':
+                player = Player("../images/boy-24.png", j, i)
+            elif key == 'C':
+                chaser = GhostMonster("../images/ghost-24.png", j, i)
 
         self.set_player(player)
         self.add_actor(player)
         player.set_smooth_move(True)
         self.add_actor(chaser)
+
+        # The ghost follows the search of the whole stage while it is far
+        # from the player, so the first one is done while setting up
+        self.get_flow_field().reachable_tiles()
         self.goal_stars = 5
         self.goal_message = "Objective: Collect {}".format(self.goal_stars) + \
             " stars before the ghost gets you and head for the door"
 
-        num_stars = 0
-        while num_stars < 7:
-            x = random.randrange(self.stage_width)
-            y = random.randrange(self.stage_height)
-            if not isinstance(self.get_actor(x, y), Actor):
-                self.add_actor(Star("../images/star-24.png", x, y))
-                num_stars += 1
+        self.place_actors(Star, "../images/star-24.png", STAR_COUNT)
 
     def setup_squishy_monster_game(self, data) -> None:
         """
         Set up a game with monsters that the player must squish with boxes.
         """
 
-        w = len(data[0])
-        h = len(
-            data) + 1
-
-        self._actors = []
-        self.stage_width, self.stage_height = w, h - 1
-        self.size = (w * ICON_SIZE, h * ICON_SIZE)
+        level = self.setup_stage(data)
         self.goal_message = "Objective: Squish all the monsters with the boxes " \
             + " and head for the door"
 
         player, chaser = None, None
 
-        for i in range(len(data)):
-            for j in range(len(data[i])):
-                key = data[i][j]
-                if key == 'P':
-                    player = Player("../images/boy-24.png", j, i)
-                elif key == 'M':
-                    chaser = SquishyMonster("../images/monster-24.png", j, i)
-                    self.add_actor(chaser)
-                    self.monster_count += 1
-                elif key == 'X':
-                    self.add_actor(Wall("../images/wall-24.png", j, i))
-                elif key == 'D':
-                    self.add_actor(Door("../images/door-24.png", j, i))
+        for key, j, i in level.spawns:
+            if key == 'P':
+                player = Player("../images/boy-24.png", j, i)
+            elif key == 'M':
+                chaser = SquishyMonster("../images/monster-24.png", j, i)
+                self.add_actor(chaser)
+                self.monster_count += 1
 
         self.set_player(player)
         self.add_actor(player)
         player.set_smooth_move(True)
 
-        num_boxes = 0
-        while num_boxes < 12:
-            x = random.randrange(self.stage_width)
-            y = random.randrange(self.stage_height)
-            if not isinstance(self.get_actor(x, y), Actor):
-                self.add_actor(Box("../images/box-24.png", x, y))
-                num_boxes += 1
+        self.place_actors(Box, "../images/box-24.png", BOX_COUNT)
+
+        self._gather_swarm()
 
     def setup_level2_game(self, data) -> None:
         """
         Set up a game with monsters that the player must squish with boxes and collect a key to win.
         """
 
-        w = len(data[0])
-        h = len(
-            data) + 1
-        self._actors = []
-        self.stage_width, self.stage_height = w, h - 1
-        self.size = (w * ICON_SIZE, h * ICON_SIZE)
+        level = self.setup_stage(data)
         self.goal_message = "Objective: Squish all the monsters with the boxes, " \
             + "get the key and head for the door"
 
         player, chaser, chaser2 = None, None, None
-        for i in range(len(data)):
-            for j in range(len(data[i])):
-                key = data[i][j]
-                if key == 'P':
-                    player = Player("../images/boy-24.png", j, i)
-                elif key == 'K':
-                    self.add_actor(Key("../images/key-24.png", j, i))
-                elif key == 'M':
-                    chaser = SquishyMonster2("../images/monster2-24.png", j, i)
-                    self.add_actor(chaser)
-                    self.monster_count += 1
-                elif key == 'N':
-                    chaser2 = SquishyMonster3("../images/monster3-24.png", j, i)
-                    self.add_actor(chaser2)
-                    self.monster_count += 1
-                elif key == 'X':
-                    self.add_actor(Wall("../images/wall-24.png", j, i))
-                elif key == 'D':
-                    self.add_actor(Door("../images/door-24.png", j, i))
+        for key, j, i in level.spawns:
+            if key == 'P':
+                player = Player("../images/boy-24.png", j, i)
+            elif key == 'K':
+                self.add_actor(Key("../images/key-24.png", j, i))
+            elif key == 'M':
+                chaser = SquishyMonster2("../images/monster2-24.png", j, i)
+                self.add_actor(chaser)
+                self.monster_count += 1
+            elif key == 'N':
+                chaser2 = SquishyMonster3("../images/monster3-24.png", j, i)
+                self.add_actor(chaser2)
+                self.monster_count += 1
 
         self.set_player(player)
         self.add_actor(player)
         player.set_smooth_move(True)
 
-        num_boxes = 0
-        while num_boxes < 12:
-            x = random.randrange(self.stage_width)
-            y = random.randrange(self.stage_height)
-            if not isinstance(self.get_actor(x, y), Actor):
-                self.add_actor(Box("../images/box-24.png", x, y))
-                num_boxes += 1
+        self.place_actors(Box, "../images/box-24.png", BOX_COUNT)
+
+        self._gather_swarm()
+
+    def _gather_swarm(self) -> None:
+        """
+        Start moving the current level's squishy monsters together in a
+        swarm, if the game batches its monsters and they can be.
+        """
+
+        if not self._batch_monsters:
+            return
+
+        # Imported here, as only batching needs NumPy
+        from swarm import SquishySwarm
+
+        self._sync_waits()
+        self._swarm = SquishySwarm.gather(self._registry.get_actors(),
+                                          self._index, self.get_tick())
+        if self._swarm is None:
+            return
+        first = self._swarm.first()
+        movers = [actor for actor in self._registry.get_active()
+                  if actor is first or not isinstance(actor, SquishyMonster)]
+        movers[movers.index(first)] = self._swarm
+        self._set_movers(movers)
+
+    def _disband_swarm(self) -> None:
+        """
+        Go back to moving the current level's actors one at a time, e.g.
+        because an actor the swarm does not know about has been added.
+        """
+
+        self._sync_waits()
+        self._swarm = None
+        self._set_movers(self._registry.get_active())
+
+    def _set_movers(self, movers: List) -> None:
+        """
+        Make <movers> what moves, in order: the active actors, with anything
+        that moves in place of some of them. Scheduled ones are scheduled
+        from their state, which must be up to date (see _sync_waits).
+        """
+
+        self._registry.set_movers(movers)
+        for mover in movers:
+            if mover.scheduled:
+                self._registry.schedule(mover, mover.get_wait(self))
+
+    def _sync_waits(self) -> None:
+        """
+        Bring the state of each scheduled actor up to date with when it next
+        moves, as the registry and the swarm only keep that to themselves.
+        """
+
+        if self._swarm is not None:
+            self._swarm.sync(self)
+        for actor, ticks in self._registry.get_waits().items():
+            actor.set_wait(self, ticks)
+
+    def _on_contacts(self, contacts: List[Contact]) -> None:
+        """
+        Make the game over if a monster has touched the player in one of the
+        <contacts> found in a tick.
+        """
+
+        for player, _ in contacts:
+            if player is self.player:
+                self.game_over()
+                return
+
+    def _section(self, name: str):
+        """
+        Return a context manager that times the code in it as the section
+        <name> of the current frame, if the game is profiled.
+        """
+
+        if self._profiler is None:
+            return _UNTIMED
+        return self._profiler.section(name)
+
+    def _start_prefetch(self) -> None:
+        """
+        Start setting up the next level in the background, if the game does
+        that and there is a next level.
+        """
+
+        if not self._prefetch_levels or self._level >= self._max_level:
+            return
+
+        # Set the level up in a copy of the game, which shares the level maps
+        # but has its own random numbers, actors and counters
+        staged = copy.copy(self)
+        staged._level = self._level + 1
+        staged._random = random.Random()
+        staged._random.setstate(self._random.getstate())
+        staged.monster_count = 0
+        staged.player = None
+        staged._prefetch = None
+
+        # The copy is not profiled, and must not count lookups as this game's
+        staged._profiler = None
+        for name in _COUNTED_LOOKUPS:
+            staged.__dict__.pop(name, None)
+        self._prefetch = LevelPrefetch(staged, staged._level,
+                                       not self._headless)
+
+    def _next_to_wall(self, tile: int) -> bool:
+        """
+        Return True iff the <tile> of the stage (counting row by row) is next
+        to a wall or the edge of the stage.
+        """
+
+        x, y = tile % self.stage_width, tile // self.stage_width
+        for next_x, next_y in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+            if not (0 <= next_x < self.stage_width and
+                    0 <= next_y < self.stage_height) or \
+                    self._index.get_static(next_x, next_y) == WALL:
+                return True
+        return False
+
+    def _pack_random_state(self) -> tuple:
+        """
+        Return the state of the random numbers used to place actors, with
+        its numbers packed into bytes.
+        """
+
+        if self._random_state is not None:
+            return self._random_state
+        version, numbers, gauss_next = self._random.getstate()
+        state = (version, struct.pack("<{}I".format(len(numbers)), *numbers),
+                 gauss_next)
+
+        # A game with its own random numbers only uses them to set up a
+        # level, so the state can be kept until the next level is set up
+        if isinstance(self._random, random.Random):
+            self._random_state = state
+        return state
+
+    def _unpack_random_state(self, state: tuple) -> None:
+        """
+        Set the state of the random numbers used to place actors to <state>,
+        as returned by _pack_random_state.
+        """
+
+        version, numbers, gauss_next = state
+        self._random.setstate((version, struct.unpack(
+            "<{}I".format(len(numbers) // 4), numbers), gauss_next))
+        self._random_state = state if isinstance(self._random,
+                                                 random.Random) else None
@@ -0,0 +1,109 @@
+"""
+This module contains the heads-up display (HUD) shown below the stage,
+which holds the level's goal message and its counters.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import pygame
+from settings import *
+
+
+class Hud:
+    """
+    A class that draws the goal message and counters of a level onto the
+    row below the stage.
+
+    Fonts are loaded once, and rendered text is cached by its string and
+    style, so a frame only renders text when something on the HUD has
+    changed.
+
+    === Private Attributes ===
+    _fonts:
+        map from a font file and size to the loaded font
+    _texts:
+        map from a string and its style to the Surface it was rendered to
+    _shown:
+        the goal message and counters currently drawn, or None if nothing
+        has been drawn yet
+    """
+    _fonts: Dict[Tuple[str, int], pygame.font.Font]
+    _texts: Dict[Tuple[str, str, int, Tuple, Tuple], pygame.Surface]
+    _shown: Optional[Tuple[str, List[Tuple[str, str]]]]
+
+    def __init__(self) -> None:
+        """
+        Initialize a HUD with no fonts loaded and nothing drawn.
+        """
+
+        self._fonts = {}
+        self._texts = {}
+        self._shown = None
+
+    def get_font(self, font_file: str, size: int) -> pygame.font.Font:
+        """
+        Return the font in <font_file> at the given <size>, loading it on
+        first use.
+        """
+
+        font = self._fonts.get((font_file, size))
+        if font is None:
+            font = pygame.font.Font(font_file, size)
+            self._fonts[(font_file, size)] = font
+        return font
+
+    def render_text(self, text: str, font_file: str = HUD_FONT,
+                    size: int = HUD_FONT_SIZE, color: Tuple = WHITE,
+                    background: Tuple = BLACK) -> pygame.Surface:
+        """
+        Return a Surface with <text> rendered in the given style, rendering
+        it only if it has not been rendered in that style before.
+        """
+
+        key = (text, font_file, size, color, background)
+        surface = self._texts.get(key)
+        if surface is None:
+            font = self.get_font(font_file, size)
+            surface = font.render(text, True, color, background)
+            self._texts[key] = surface
+        return surface
+
+    def reset(self) -> None:
+        """
+        Forget what is drawn, so the next call to draw redraws the HUD.
+        """
+
+        self._shown = None
+
+    def draw(self, game: 'Game',
+             surface: pygame.Surface) -> Optional[pygame.Rect]:
+        """
+        Draw the <game>'s goal message and counters onto the bottom row of
+        <surface>, if they have changed since they were last drawn.
+        Return the rectangle that was redrawn, or None if nothing changed.
+        """
+
+        shown = (game.goal_message, game.get_counters())
+        if shown == self._shown:
+            return None
+        self._shown = shown
+
+        row = pygame.Rect(0, surface.get_height() - ICON_SIZE,
+                          surface.get_width(), ICON_SIZE)
+        surface.fill(BLACK, row)
+
+        center_x = row.width // 2
+        text = self.render_text(game.goal_message)
+        textRect = text.get_rect()
+        textRect.center = (center_x, row.top + 0.3 * ICON_SIZE)
+        surface.blit(text, textRect)
+
+        counters = "   ".join("{}: {}".format(label, value)
+                              for label, value in shown[1])
+        if counters:
+            text = self.render_text(counters)
+            textRect = text.get_rect()
+            textRect.center = (center_x, row.top + 0.75 * ICON_SIZE)
+            surface.blit(text, textRect)
+
+        return row
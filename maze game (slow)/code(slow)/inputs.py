@@ -0,0 +1,146 @@
+"""
+This module contains the input sources that tell the game which keys are
+pressed on each simulation tick.
+"""
+
+from __future__ import annotations
+from typing import FrozenSet, Iterable, Iterator
+import pygame
+
+# Actions a programmatic input source can take on a tick
+NOOP, LEFT, RIGHT, UP, DOWN = range(5)
+
+# The key each action stands for
+ACTION_KEYS = {
+    LEFT: pygame.K_LEFT,
+    RIGHT: pygame.K_RIGHT,
+    UP: pygame.K_UP,
+    DOWN: pygame.K_DOWN,
+}
+
+
+class KeyState:
+    """
+    A snapshot of which keys are pressed, indexed by pygame key constant in
+    the same way as the result of pygame.key.get_pressed().
+
+    === Private Attributes ===
+    _pressed:
+        the keys that are pressed
+    """
+    _pressed: FrozenSet[int]
+
+    def __init__(self, pressed: Iterable[int] = ()) -> None:
+        """
+        Initialize a key state where exactly the keys in <pressed> are
+        pressed.
+        """
+
+        self._pressed = frozenset(pressed)
+
+    def __getitem__(self, key: int) -> bool:
+        """
+        Return True iff <key> is pressed.
+        """
+
+        return key in self._pressed
+
+
+class InputSource:
+    """
+    A source of the keys pressed on each simulation tick.
+
+    This is an abstract class. Only subclasses should be instantiated.
+    """
+
+    def poll(self, game: 'Game') -> KeyState:
+        """
+        Return the keys pressed on the <game>'s current tick, registering any
+        new key press with the game's player.
+        """
+
+        raise NotImplementedError
+
+
+class KeyboardInput(InputSource):
+    """
+    An input source that reads the keyboard. Key presses are registered with
+    the player by Game.on_event as they arrive.
+    """
+
+    def poll(self, game: 'Game') -> KeyState:
+        """
+        Return the keys currently held down on the keyboard.
+        """
+
+        return pygame.key.get_pressed()
+
+
+class ScriptedInput(InputSource):
+    """
+    An input source that takes one action per tick from a script, and
+    holds no keys once the script has run out.
+
+    === Private Attributes ===
+    _actions:
+        the actions left in the script
+    """
+    _actions: Iterator[int]
+
+    def __init__(self, actions: Iterable[int]) -> None:
+        """
+        Initialize an input source that takes the <actions> in order, one
+        per tick.
+        """
+
+        self._actions = iter(actions)
+
+    def poll(self, game: 'Game') -> KeyState:
+        """
+        Press the key for the next action in the script, as if it had just
+        been pressed down, and return it as the only key held.
+        """
+
+        return press(game, next(self._actions, NOOP))
+
+
+class ActionInput(InputSource):
+    """
+    An input source that takes the action it has been given on each tick,
+    for a program that picks each action as the game runs (see
+    environment.py).
+
+    === Public Attributes ===
+    action:
+        the action to take on each tick
+    """
+    action: int
+
+    def __init__(self, action: int = NOOP) -> None:
+        """
+        Initialize an input source that takes the given <action>.
+        """
+
+        self.action = action
+
+    def poll(self, game: 'Game') -> KeyState:
+        """
+        Press the key for the action, as if it had just been pressed down,
+        and return it as the only key held.
+        """
+
+        return press(game, self.action)
+
+
+def press(game: 'Game', action: int) -> KeyState:
+    """
+    Register the key for <action> with the <game>'s player as a key press,
+    and return a key state with only that key held.
+    """
+
+    key = ACTION_KEYS.get(action)
+    if key is None:
+        return KeyState()
+    if game.player is not None:
+        game.player.register_event(key)
+    return KeyState((key,))
@@ -0,0 +1,168 @@
+"""
+This module contains the compiled level format, and the compiler and loader
+for it.
+
+A compiled level file holds a header, the kind of static tile at each tile
+of the stage (one byte per tile, row by row) and a table of the actors that
+spawn on the stage. Loading one memory-maps the file and uses the tile bytes
+in place, so a level is built without parsing text or looping over its
+tiles in Python.
+
+Maps in data/ can be compiled from the command line, e.g.:
+    python levelfile.py ../data/maze1.txt ../data/maze3.txt
+which writes ../data/maze1.lvl and ../data/maze3.lvl. A generated maze can be
+compiled with e.g.:
+    python levelfile.py --maze 2000 2000 --seed 7 --level 1 -o ../data/big.lvl
+"""
+
+from __future__ import annotations
+import argparse
+import mmap
+import os
+import re
+import struct
+from typing import List, Tuple, Union
+from settings import WALL, DOOR
+
+# The file name suffix of compiled level files
+LEVEL_FILE_SUFFIX = ".lvl"
+
+# The header: magic bytes, format version, stage width and height, and the
+# number of spawns
+_HEADER = struct.Struct("<4sHIII")
+_MAGIC = b"MAZL"
+_VERSION = 1
+
+# One spawn: the map character of the actor, and its x and y position
+_SPAWN = struct.Struct("<cII")
+
+# The static tile for each map character; other characters are empty tiles
+_TILE_BYTES = bytearray(256)
+_TILE_BYTES[ord('X')] = WALL
+_TILE_BYTES[ord('D')] = DOOR
+_TILE_BYTES = bytes(_TILE_BYTES)
+
+# Map characters that spawn an actor
+_SPAWN_CHARS = re.compile(r"[^XDO]")
+
+
+class LevelData:
+    """
+    The static tiles and the spawns of a level map.
+
+    === Public Attributes ===
+    width:
+        the number of tiles across the stage
+    height:
+        the number of tiles down the stage
+    tiles:
+        the kind of static tile at each tile of the stage, row by row, or
+        EMPTY where there is none
+    spawns:
+        the map character and x and y position of each actor that spawns on
+        the stage, row by row
+    """
+    width: int
+    height: int
+    tiles: Union[bytes, bytearray, memoryview]
+    spawns: List[Tuple[str, int, int]]
+
+    def __init__(self, width: int, height: int,
+                 tiles: Union[bytes, bytearray, memoryview],
+                 spawns: List[Tuple[str, int, int]]) -> None:
+        """
+        Initialize the level data for a <width> x <height> stage with the
+        given <tiles> and <spawns>.
+        """
+
+        self.width, self.height = width, height
+        self.tiles = tiles
+        self.spawns = spawns
+
+
+def parse_map(data: List[List[str]]) -> LevelData:
+    """
+    Return the level data for the map <data>, in the format returned by
+    load_map.
+    """
+
+    width, height = len(data[0]), len(data)
+    tiles = bytearray()
+    spawns = []
+    for y, row in enumerate(data):
+        line = "".join(row)
+        tiles += line.encode().translate(_TILE_BYTES)
+        for match in _SPAWN_CHARS.finditer(line):
+            spawns.append((match.group(), match.start(), y))
+    return LevelData(width, height, tiles, spawns)
+
+
+def compile_level(level: LevelData, filename: str) -> None:
+    """
+    Write the <level> to a compiled level file called <filename>.
+    """
+
+    with open(filename, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, level.width, level.height,
+                             len(level.spawns)))
+        f.write(level.tiles)
+        for key, x, y in level.spawns:
+            f.write(_SPAWN.pack(key.encode(), x, y))
+
+
+def load_level(filename: str) -> LevelData:
+    """
+    Return the level data in the compiled level file <filename>.
+
+    The file is memory-mapped, and the tiles of the returned level are a
+    read-only view of the mapping.
+    """
+
+    with open(filename, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, width, height, count = _HEADER.unpack_from(mapped, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("{} is not a compiled level file".format(filename))
+
+    start = _HEADER.size
+    tiles = memoryview(mapped)[start:start + width * height]
+    start += width * height
+    spawns = [(key.decode(), x, y) for key, x, y in _SPAWN.iter_unpack(
+        mapped[start:start + count * _SPAWN.size])]
+    return LevelData(width, height, tiles, spawns)
+
+
+def main() -> None:
+    """
+    Compile the map files or generated maze given on the command line.
+    """
+
+    parser = argparse.ArgumentParser(description="Compile level maps.")
+    parser.add_argument("maps", nargs="*",
+                        help="map files to compile, each written next to "
+                             "itself with the suffix " + LEVEL_FILE_SUFFIX)
+    parser.add_argument("--maze", type=int, nargs=2, metavar=("WIDTH", "HEIGHT"),
+                        help="compile a generated maze of this size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--level", type=int, default=0,
+                        help="the level to place the maze's actors for")
+    parser.add_argument("-o", "--output", help="the file to write the maze to")
+    args = parser.parse_args()
+
+    # Imported here, as both of these modules import this one
+    from game2 import load_map
+    from mazegen import MazeSpec
+
+    for filename in args.maps:
+        compile_level(parse_map(load_map(filename)),
+                      os.path.splitext(filename)[0] + LEVEL_FILE_SUFFIX)
+    if args.maze:
+        if not args.output:
+            parser.error("--maze needs --output")
+        spec = MazeSpec(args.maze[0], args.maze[1], args.seed)
+        compile_level(spec.build(args.level), args.output)
+
+
+if __name__ == "__main__":
+    main()
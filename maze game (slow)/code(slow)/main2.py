@@ -1,10 +1,31 @@
 """
 This module initializes and runs the main game.
+
+To see where the time goes in each frame, run it with a profiler, e.g.:
+    python main2.py --profile profile.json --trace trace.json
+F3 then shows the profiler's figures over the game, and they are written
+out when the game ends.
 """
 
+import argparse
 from game2 import Game
+from profiler import FrameProfiler
 
 if __name__ == "__main__":
 
-    game = Game()
+    parser = argparse.ArgumentParser(description="Play the maze game.")
+    parser.add_argument("--profile", metavar="FILE", default=None,
+                        help="time each frame, and write the figures for the "
+                             "last frames to FILE as JSON when the game ends")
+    parser.add_argument("--trace", metavar="FILE", default=None,
+                        help="time each frame, and write the last frames to "
+                             "FILE as a Chrome trace when the game ends")
+    args = parser.parse_args()
+
+    profiler = FrameProfiler() if args.profile or args.trace else None
+    game = Game(profiler=profiler)
     game.on_execute()
+    if args.profile:
+        profiler.write_json(args.profile)
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
@@ -0,0 +1,259 @@
+"""
+This module generates maze levels procedurally, from a seed, in the same
+map format as the files in data/.
+
+A generated map can be used as a level by putting a MazeSpec in the list of
+level maps given to Game, or written out as a map file, e.g.:
+    python mazegen.py 200 150 --seed 7 --level 1 > ../data/big_maze.txt
+"""
+
+from __future__ import annotations
+import argparse
+import random
+import sys
+from typing import List, Optional, Tuple
+from settings import DOOR
+from levelfile import LevelData
+
+# Bytes used for the tiles of a maze while it is generated
+_WALL, _OPEN = 1, 0
+_TILE_CHARS = bytes.maketrans(b'\x00\x01', b'OX')
+
+
+class MazeSpec:
+    """
+    A description of a procedurally generated maze. The same description
+    always generates the same map.
+
+    === Public Attributes ===
+    width:
+        the number of tiles across the maze, at least 5
+    height:
+        the number of tiles down the maze, at least 5
+    seed:
+        the seed of the random numbers used to generate the maze
+    monsters:
+        the number of monsters to place in a monster level, or None to place
+        one for every 500 open tiles
+    openness:
+        the fraction of the maze's inner walls to knock down after the maze
+        is carved, so that it has loops and room to push boxes around
+    """
+    width: int
+    height: int
+    seed: int
+    monsters: Optional[int]
+    openness: float
+
+    def __init__(self, width: int, height: int, seed: int = 0,
+                 monsters: Optional[int] = None,
+                 openness: float = 0.1) -> None:
+        """
+        Initialize a description of a <width> x <height> maze generated from
+        the given <seed>.
+        """
+
+        if width < 5 or height < 5:
+            raise ValueError("A maze must be at least 5 x 5 tiles")
+        self.width, self.height = width, height
+        self.seed = seed
+        self.monsters = monsters
+        self.openness = openness
+
+    def __repr__(self) -> str:
+        """
+        Return a string representation of this maze description.
+        """
+
+        return "MazeSpec({}, {}, seed={})".format(self.width, self.height,
+                                                  self.seed)
+
+    def generate(self, level: int) -> List[List[str]]:
+        """
+        Return the map data for this maze set up for the given <level>, in
+        the same format as load_map.
+        """
+
+        return generate_maze(self.width, self.height, self.seed, level,
+                             self.monsters, self.openness)
+
+    def build(self, level: int) -> LevelData:
+        """
+        Return the level data for this maze set up for the given <level>.
+        This makes the same maze as generate, without building a map of
+        characters first.
+        """
+
+        return build_maze(self.width, self.height, self.seed, level,
+                          self.monsters, self.openness)
+
+
+def generate_maze(width: int, height: int, seed: int, level: int,
+                  monsters: Optional[int] = None,
+                  openness: float = 0.1) -> List[List[str]]:
+    """
+    Return the map data for a <width> x <height> maze generated from <seed>,
+    with the player, door, ghost, monsters and key placed as needed by the
+    given <level>. See MazeSpec for the meaning of <monsters> and <openness>.
+    """
+
+    tiles, spawns, door = _make_maze(width, height, seed, level, monsters,
+                                     openness)
+    data = [list(tiles[y * width:(y + 1) * width].translate(_TILE_CHARS)
+                 .decode()) for y in range(height)]
+    data[door[1]][door[0]] = 'D'
+    for key, x, y in spawns:
+        data[y][x] = key
+    return data
+
+
+def build_maze(width: int, height: int, seed: int, level: int,
+               monsters: Optional[int] = None,
+               openness: float = 0.1) -> LevelData:
+    """
+    Return the level data for the maze that generate_maze would make with
+    the same arguments.
+    """
+
+    tiles, spawns, door = _make_maze(width, height, seed, level, monsters,
+                                     openness)
+    tiles[door[1] * width + door[0]] = DOOR
+    spawns.sort(key=lambda spawn: (spawn[2], spawn[1]))
+    return LevelData(width, height, tiles, spawns)
+
+
+def _make_maze(width: int, height: int, seed: int, level: int,
+               monsters: Optional[int], openness: float
+               ) -> Tuple[bytearray, List[Tuple[str, int, int]], Tuple[int, int]]:
+    """
+    Return the wall tiles of the maze described by the arguments (see
+    generate_maze), the map character and position of each actor placed in
+    it, and the position of its door.
+    """
+
+    rng = random.Random(seed)
+    tiles = _carve(width, height, rng)
+    _knock_down_walls(tiles, width, height, openness, rng)
+
+    # Rooms are the open tiles at odd coordinates, which the carving always
+    # leaves open
+    last_x = width - 2 if (width - 2) % 2 else width - 3
+    last_y = height - 2 if (height - 2) % 2 else height - 3
+    door_y = (height // 2) | 1
+    if door_y > last_y:
+        door_y = last_y
+    for x in range(last_x + 1, width - 1):
+        tiles[door_y * width + x] = _OPEN
+
+    spawns = [('P', 1, 1)]
+    if level == 0:
+        spawns.append(('C', last_x, last_y))
+    else:
+        if level == 2:
+            spawns.append(('K', 1, last_y))
+        if monsters is None:
+            monsters = max(1, tiles.count(_OPEN) // 500)
+        rooms = ((last_x + 1) // 2) * ((last_y + 1) // 2)
+        free = _free_rooms({(x, y) for _, x, y in spawns}, last_x, last_y)
+        monsters = min(monsters, rooms // 2, len(free))
+        kinds = 'M' if level == 1 else 'MN'
+        for i, (x, y) in enumerate(rng.sample(free, monsters)):
+            spawns.append((kinds[i % len(kinds)], x, y))
+
+    return tiles, spawns, (width - 1, door_y)
+
+
+def _carve(width: int, height: int, rng: random.Random) -> bytearray:
+    """
+    Return the tiles of a perfect maze of the given size, carved by a
+    randomized depth-first search over the rooms at odd coordinates.
+    """
+
+    tiles = bytearray([_WALL]) * (width * height)
+    rooms_x, rooms_y = (width - 1) // 2, (height - 1) // 2
+    visited = bytearray(rooms_x * rooms_y)
+
+    stack = [0]
+    visited[0] = 1
+    tiles[width + 1] = _OPEN
+    while stack:
+        room = stack[-1]
+        rx, ry = room % rooms_x, room // rooms_x
+        neighbours = []
+        if rx > 0 and not visited[room - 1]:
+            neighbours.append(room - 1)
+        if rx < rooms_x - 1 and not visited[room + 1]:
+            neighbours.append(room + 1)
+        if ry > 0 and not visited[room - rooms_x]:
+            neighbours.append(room - rooms_x)
+        if ry < rooms_y - 1 and not visited[room + rooms_x]:
+            neighbours.append(room + rooms_x)
+        if not neighbours:
+            stack.pop()
+            continue
+
+        nxt = neighbours[rng.randrange(len(neighbours))]
+        visited[nxt] = 1
+        nx, ny = nxt % rooms_x, nxt // rooms_x
+        tiles[(2 * ny + 1) * width + 2 * nx + 1] = _OPEN
+        tiles[(ry + ny + 1) * width + rx + nx + 1] = _OPEN
+        stack.append(nxt)
+
+    return tiles
+
+
+def _knock_down_walls(tiles: bytearray, width: int, height: int,
+                      openness: float, rng: random.Random) -> None:
+    """
+    Open up about <openness> of the walls in <tiles> that separate two
+    rooms, giving the maze loops.
+    """
+
+    if openness <= 0:
+        return
+    for y in range(1, height - 1):
+        for x in range(1 + y % 2, width - 1, 2):
+            i = y * width + x
+            if tiles[i] == _WALL and rng.random() < openness:
+                # Only walls between two open tiles, so pillars stay
+                if (tiles[i - 1] == tiles[i + 1] == _OPEN
+                        or tiles[i - width] == tiles[i + width] == _OPEN):
+                    tiles[i] = _OPEN
+
+
+def _free_rooms(taken: set, last_x: int, last_y: int
+                ) -> List[Tuple[int, int]]:
+    """
+    Return every room up to <last_x> and <last_y> that is not in <taken>
+    and is not right next to the player's start. There are none on the
+    smallest mazes.
+    """
+
+    return [(x, y) for y in range(1, last_y + 1, 2)
+            for x in range(1, last_x + 1, 2)
+            if (x, y) not in taken and x + y > 6]
+
+
+def main() -> None:
+    """
+    Write a generated map to stdout, in the format of the files in data/.
+    """
+
+    parser = argparse.ArgumentParser(description="Generate a maze map.")
+    parser.add_argument("width", type=int)
+    parser.add_argument("height", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--level", type=int, default=0,
+                        help="the level to place actors for (0, 1 or 2)")
+    parser.add_argument("--monsters", type=int, default=None)
+    parser.add_argument("--openness", type=float, default=0.1)
+    args = parser.parse_args()
+
+    data = generate_maze(args.width, args.height, args.seed, args.level,
+                         args.monsters, args.openness)
+    for row in data:
+        sys.stdout.write(" ".join(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
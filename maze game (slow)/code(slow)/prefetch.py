@@ -0,0 +1,101 @@
+"""
+This module sets up the next level of a game in a background thread while
+the current level is played, so that the game does not freeze when the
+player goes through the door.
+"""
+
+from __future__ import annotations
+import sys
+import threading
+import traceback
+import warnings
+from typing import Optional
+from actors2 import STATIC_TILES
+from assets import ASSETS
+
+
+class LevelPrefetch:
+    """
+    A level of a game being set up in the background, in a copy of the game.
+
+    A game only draws random numbers when it sets up a level, so setting the
+    next level up ahead of time, with a copy of the game's random numbers,
+    gives exactly the level that setting it up at the door would have.
+
+    Setting up a level is Python code, so it shares the interpreter with the
+    game as it runs. It mostly runs while the game sleeps between frames.
+
+    === Public Attributes ===
+    level:
+        the level being set up
+
+    === Private Attributes ===
+    _staged:
+        the copy of the game the level is set up in
+    _preload_icons:
+        true iff the images of the level's actors are loaded too
+    _thread:
+        the thread setting up the level
+    _error:
+        the exception raised while setting up the level, or None
+    """
+    level: int
+    _staged: 'Game'
+    _preload_icons: bool
+    _thread: threading.Thread
+    _error: Optional[BaseException]
+
+    def __init__(self, staged: 'Game', level: int,
+                 preload_icons: bool) -> None:
+        """
+        Start setting up the <level> in <staged>, a copy of a game made for
+        it, and loading the images of its actors if <preload_icons> is True.
+        """
+
+        self.level = level
+        self._staged = staged
+        self._preload_icons = preload_icons
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="level-prefetch-{}".format(level))
+        self._thread.start()
+
+    def finish(self) -> Optional['Game']:
+        """
+        Wait until the level has been set up, and return the copy of the game
+        it was set up in, or None if setting it up failed.
+
+        A failure is reported as a RuntimeWarning, as the game can still set
+        the level up itself. In Python's development mode (python -X dev)
+        the exception is raised instead, so that it is not missed.
+        """
+
+        self._thread.join()
+        error = self._error
+        if error is None:
+            return self._staged
+        if sys.flags.dev_mode:
+            raise error
+        warnings.warn("Setting up level {} in the background failed, so it "
+                      "is set up again:\n{}".format(
+                          self.level, "".join(traceback.format_exception(
+                              type(error), error, error.__traceback__))),
+                      RuntimeWarning, stacklevel=2)
+        return None
+
+    def _run(self) -> None:
+        """
+        Set up the level, recording any exception rather than letting it end
+        the thread.
+        """
+
+        try:
+            self._staged.setup_current_level()
+            if self._preload_icons:
+                icon_files = {actor.get_icon_file()
+                              for actor in self._staged.get_actors()}
+                icon_files.update(icon_file for _, icon_file
+                                  in STATIC_TILES.values())
+                ASSETS.preload(icon_files)
+        except Exception as error:
+            self._error = error
@@ -0,0 +1,426 @@
+"""
+This module contains the frame profiler, which times what the game does in
+each frame, so that a slow frame can be pinned on the part of the game that
+took the time.
+
+A game is profiled by giving it a profiler, e.g.:
+    profiler = FrameProfiler()
+    Game(profiler=profiler).on_execute()
+    profiler.write_json("profile.json")
+    profiler.write_chrome_trace("trace.json")
+The trace can be opened in chrome://tracing or https://ui.perfetto.dev.
+While a profiled game runs, F3 shows or hides the profiler's overlay.
+"""
+
+from __future__ import annotations
+import json
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+import pygame
+from settings import *
+
+# The number of recent frames the profiler keeps
+FRAME_HISTORY = 300
+
+# The upper bounds, in milliseconds, of the buckets of the frame time
+# histogram; the last bucket holds every longer frame
+HISTOGRAM_BOUNDS = (4, 8, 16, 33, 50, 100)
+
+# How often the overlay's figures are worked out again, in seconds, so that
+# they can be read as they change
+OVERLAY_REFRESH_TIME = 0.25
+OVERLAY_FONT_SIZE = 12
+
+
+class Frame:
+    """
+    What the game did in one frame, and how long it took.
+
+    === Public Attributes ===
+    start:
+        the time the frame started, in seconds
+    interval:
+        the time from the start of the previous frame to the start of this
+        one, in seconds, or None for the first frame
+    duration:
+        the time the frame's work took, in seconds
+    spans:
+        the name, start time and duration of each timed section of the
+        frame, in the order they ended
+    moves:
+        map from each class of actor to the time its moves took in total
+    ticks:
+        the number of simulation ticks the frame ran
+    counts:
+        map from each counted call to the number of calls in each tick the
+        frame ran
+    """
+    start: float
+    interval: Optional[float]
+    duration: float
+    spans: List[Tuple[str, float, float]]
+    moves: Dict[str, float]
+    ticks: int
+    counts: Dict[str, List[int]]
+
+    def __init__(self, start: float, interval: Optional[float]) -> None:
+        """
+        Initialize a frame started at <start>, which came <interval> seconds
+        after the previous one.
+        """
+
+        self.start = start
+        self.interval = interval
+        self.duration = 0.0
+        self.spans = []
+        self.moves = {}
+        self.ticks = 0
+        self.counts = {}
+
+
+class _Section:
+    """
+    A context manager that times one section of a frame.
+
+    === Private Attributes ===
+    _profiler:
+        the profiler the time is recorded in
+    _name:
+        the name of the section
+    _start:
+        the time the section started
+    """
+    _profiler: FrameProfiler
+    _name: str
+    _start: float
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler: FrameProfiler, name: str) -> None:
+        """
+        Initialize a section called <name> of the current frame of
+        <profiler>.
+        """
+
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self) -> None:
+        """
+        Start timing the section.
+        """
+
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        """
+        Record the time the section took.
+        """
+
+        frame = self._profiler.current
+        if frame is not None:
+            frame.spans.append((self._name, self._start,
+                                time.perf_counter() - self._start))
+
+
+class FrameProfiler:
+    """
+    A profiler that keeps the timings of a game's recent frames: how long
+    each frame took, the time spent in each part of it (handling events,
+    running ticks, moving each class of actor, checking for a win and
+    rendering), and the number of actor lookups in each tick.
+
+    Nothing is timed unless a game is given a profiler, so an unprofiled
+    game runs exactly as fast as before.
+
+    === Public Attributes ===
+    current:
+        the frame being recorded, or None between frames
+    overlay_visible:
+        true iff the overlay is drawn over the game
+
+    === Private Attributes ===
+    _frames:
+        the most recent frames recorded, oldest first
+    _tick_counts:
+        map from each counted call to the number of calls so far in the
+        tick being run
+    _last_start:
+        the start time of the previous frame, or None before the first
+    _font:
+        the font the overlay is written in, or None until it is first drawn
+    _overlay:
+        the overlay last drawn, or None if it has to be drawn again
+    _overlay_time:
+        the time the overlay was last drawn
+    """
+    current: Optional[Frame]
+    overlay_visible: bool
+    _frames: Deque[Frame]
+    _tick_counts: Dict[str, int]
+    _last_start: Optional[float]
+    _font: Optional[pygame.font.Font]
+    _overlay: Optional[pygame.Surface]
+    _overlay_time: float
+
+    def __init__(self, history: int = FRAME_HISTORY) -> None:
+        """
+        Initialize a profiler that keeps the last <history> frames.
+        """
+
+        self.current = None
+        self.overlay_visible = False
+        self._frames = deque(maxlen=history)
+        self._tick_counts = {}
+        self._last_start = None
+        self._font = None
+        self._overlay = None
+        self._overlay_time = 0.0
+
+    def get_frames(self) -> List[Frame]:
+        """
+        Return the most recent frames recorded, oldest first.
+        """
+
+        return list(self._frames)
+
+    def begin_frame(self) -> None:
+        """
+        Start recording a new frame.
+        """
+
+        start = time.perf_counter()
+        interval = start - self._last_start if self._last_start is not None \
+            else None
+        self._last_start = start
+        self.current = Frame(start, interval)
+
+    def end_frame(self) -> None:
+        """
+        Finish recording the current frame.
+        """
+
+        frame = self.current
+        if frame is None:
+            return
+        frame.duration = time.perf_counter() - frame.start
+        self._frames.append(frame)
+        self.current = None
+
+    def section(self, name: str) -> _Section:
+        """
+        Return a context manager that records the time the code in it takes
+        as the section <name> of the current frame.
+        """
+
+        return _Section(self, name)
+
+    def move_actors(self, actors: Iterable, game: 'Game') -> None:
+        """
+        Move each of the <actors> of the <game> in turn, as Game.on_loop
+        does, timing the moves of each class of actor.
+        """
+
+        clock = time.perf_counter
+        moves = self.current.moves if self.current is not None else {}
+        for actor in actors:
+            start = clock()
+            actor.move(game)
+            name = type(actor).__name__
+            moves[name] = moves.get(name, 0.0) + clock() - start
+
+    def counted(self, name: str, function: Callable) -> Callable:
+        """
+        Return a function that does the same as <function>, and counts each
+        call as a call to <name> in the tick being run.
+        """
+
+        counts = self._tick_counts
+        counts.setdefault(name, 0)
+
+        def counted_function(*args):
+            counts[name] += 1
+            return function(*args)
+        return counted_function
+
+    def end_tick(self) -> None:
+        """
+        Record the calls counted in the tick that has just run.
+        """
+
+        frame = self.current
+        if frame is not None:
+            frame.ticks += 1
+            for name, count in self._tick_counts.items():
+                frame.counts.setdefault(name, []).append(count)
+        for name in self._tick_counts:
+            self._tick_counts[name] = 0
+
+    def summary(self) -> Dict:
+        """
+        Return the figures for the recent frames, as a dictionary that can
+        be written as JSON. Times are in milliseconds.
+        """
+
+        frames = self._frames
+        intervals = [f.interval * 1000 for f in frames if f.interval is not None]
+        sections: Dict[str, List[float]] = {}
+        moves: Dict[str, float] = {}
+        counts: Dict[str, List[int]] = {}
+        for frame in frames:
+            totals: Dict[str, float] = {}
+            for name, _, duration in frame.spans:
+                totals[name] = totals.get(name, 0.0) + duration * 1000
+            for name, total in totals.items():
+                sections.setdefault(name, []).append(total)
+            for name, total in frame.moves.items():
+                moves[name] = moves.get(name, 0.0) + total * 1000
+            for name, per_tick in frame.counts.items():
+                counts.setdefault(name, []).extend(per_tick)
+
+        histogram = {}
+        lower = 0
+        for bound in HISTOGRAM_BOUNDS:
+            histogram["{}-{} ms".format(lower, bound)] = \
+                sum(lower <= t < bound for t in intervals)
+            lower = bound
+        histogram["{}+ ms".format(lower)] = sum(t >= lower for t in intervals)
+
+        return {
+            "frames": len(frames),
+            "frame_time_ms": _stats(intervals),
+            "frame_work_ms": _stats([f.duration * 1000 for f in frames]),
+            "frame_time_histogram": histogram,
+            # A frame that did not run a section spent no time in it
+            "sections_ms_per_frame": {
+                name: _stats(times + [0.0] * (len(frames) - len(times)))
+                for name, times in sections.items()},
+            "move_ms_per_frame": {name: round(total / max(len(frames), 1), 4)
+                                  for name, total in sorted(moves.items())},
+            "calls_per_tick": {name: _stats(per_tick)
+                               for name, per_tick in counts.items()},
+        }
+
+    def write_json(self, filename: str) -> None:
+        """
+        Write the figures for the recent frames to the file <filename> as
+        JSON.
+        """
+
+        with open(filename, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def chrome_trace(self) -> Dict:
+        """
+        Return the recent frames in the Chrome trace event format.
+
+        Each frame and each timed section is a span. The time each class of
+        actor took to move and the calls counted in each tick, which are
+        spread through a frame rather than taken in one go, are counters.
+        """
+
+        events = []
+        for frame in self._frames:
+            events.append(_span("frame", frame.start, frame.duration))
+            for name, start, duration in frame.spans:
+                events.append(_span(name, start, duration))
+            if frame.moves:
+                events.append({
+                    "name": "move (ms)", "ph": "C", "pid": 1, "tid": 1,
+                    "ts": frame.start * 1e6,
+                    "args": {name: total * 1000
+                             for name, total in frame.moves.items()}})
+            if frame.counts:
+                events.append({
+                    "name": "calls per tick", "ph": "C", "pid": 1, "tid": 1,
+                    "ts": frame.start * 1e6,
+                    "args": {name: max(per_tick)
+                             for name, per_tick in frame.counts.items()}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, filename: str) -> None:
+        """
+        Write the recent frames to the file <filename> in the Chrome trace
+        event format.
+        """
+
+        with open(filename, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def draw_overlay(self, screen: pygame.Surface) -> pygame.Rect:
+        """
+        Draw the overlay onto the top left of <screen>, and return the
+        rectangle it covers. The figures on it are only worked out again
+        every OVERLAY_REFRESH_TIME seconds.
+        """
+
+        now = time.perf_counter()
+        if self._overlay is None or now - self._overlay_time >= \
+                OVERLAY_REFRESH_TIME:
+            self._overlay = self._render_overlay()
+            self._overlay_time = now
+        return screen.blit(self._overlay, (0, 0))
+
+    def _render_overlay(self) -> pygame.Surface:
+        """
+        Return a Surface with the figures for the recent frames written on
+        it.
+        """
+
+        if self._font is None:
+            self._font = pygame.font.Font(HUD_FONT, OVERLAY_FONT_SIZE)
+
+        summary = self.summary()
+        frame_time = summary["frame_time_ms"]
+        work = summary["frame_work_ms"]
+        lines = ["frame {:.1f} ms avg, {:.1f} max   work {:.1f} avg, {:.1f} max"
+                 .format(frame_time["mean"], frame_time["max"], work["mean"],
+                         work["max"])]
+        lines.append("   ".join("{} {:.2f}".format(name, stats["mean"])
+                               for name, stats in
+                               summary["sections_ms_per_frame"].items()))
+        moves = sorted(summary["move_ms_per_frame"].items(),
+                       key=lambda item: -item[1])
+        lines.append("move: " + "   ".join("{} {:.2f}".format(name, total)
+                                          for name, total in moves[:4]))
+        lines.append("per tick: " + "   ".join(
+            "{} {:.0f}".format(name, stats["mean"])
+            for name, stats in summary["calls_per_tick"].items()))
+        lines.append("frames: " + "  ".join(
+            "{} {}".format(bucket.replace(" ms", ""), count)
+            for bucket, count in summary["frame_time_histogram"].items()))
+
+        texts = [self._font.render(line, True, WHITE) for line in lines]
+        line_height = self._font.get_linesize()
+        overlay = pygame.Surface((max(text.get_width() for text in texts) + 8,
+                                  line_height * len(texts) + 8))
+        overlay.fill(BLACK)
+        for i, text in enumerate(texts):
+            overlay.blit(text, (4, 4 + i * line_height))
+        return overlay
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    """
+    Return the mean, median, 95th percentile and maximum of <values>, or
+    zeros if there are none.
+    """
+
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(values)
+    return {"mean": round(sum(ordered) / len(ordered), 4),
+            "p50": round(ordered[len(ordered) // 2], 4),
+            "p95": round(ordered[min(len(ordered) - 1,
+                                     int(len(ordered) * 0.95))], 4),
+            "max": round(ordered[-1], 4)}
+
+
+def _span(name: str, start: float, duration: float) -> Dict:
+    """
+    Return a Chrome trace event for a span called <name> that started at
+    <start> and took <duration> seconds.
+    """
+
+    return {"name": name, "ph": "X", "pid": 1, "tid": 1,
+            "ts": start * 1e6, "dur": duration * 1e6}
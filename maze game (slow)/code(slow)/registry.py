@@ -0,0 +1,263 @@
+"""
+This module contains the actor registry, which keeps the actors of a level
+and the order they move in.
+"""
+
+from __future__ import annotations
+from bisect import bisect_left
+from itertools import filterfalse, islice
+from typing import Dict, Iterable, Iterator, List, Set
+from actors2 import Actor
+from scheduler import TickWheel
+
+
+class ActorRegistry:
+    """
+    The actors of a level, split into the idle ones, whose move does nothing
+    (stars, boxes, keys...), and the active ones, which are the only ones
+    moved. A tick then costs time for each actor that moves, however many
+    idle actors the level holds.
+
+    Most active actors move on every tick. Scheduled ones (e.g. squishy
+    monsters, which only step every so often) are kept on a tick wheel
+    instead, and are only moved on the ticks they are due on, when they are
+    moved in their place among the others. Each time a scheduled actor
+    moves, it must be scheduled again (see Game.schedule), or it does not
+    move again.
+
+    Removing an actor takes the same time however many actors there are. An
+    active actor removed during a tick (e.g. a monster squished by a box the
+    player pushed) is skipped from then on, and is only taken out of the
+    order actors move in once enough of them have been removed, so actors
+    can be removed while the actors are being moved without any of the
+    others being skipped.
+
+    === Private Attributes ===
+    _actors:
+        the actors in the level, in the order they were added (the values
+        are unused)
+    _movers:
+        what moves on every tick, in order: the active actors that are not
+        scheduled, or things that move in their place (see
+        Game._gather_swarm), including actors that have been removed but not
+        yet taken out
+    _mover_places:
+        the place of each of _movers in the order things move, in the same
+        order
+    _places:
+        map from each scheduled actor, or thing that moves in the place of
+        some, to its place in the order things move
+    _next_place:
+        the place in the order things move of the next actor added
+    _removed:
+        the active actors that have been removed but are still in _movers
+    _wheel:
+        the tick wheel the scheduled actors are kept on
+    """
+    _actors: Dict[Actor, None]
+    _movers: List
+    _mover_places: List[int]
+    _places: Dict[object, int]
+    _next_place: int
+    _removed: Set[Actor]
+    _wheel: TickWheel
+
+    def __init__(self) -> None:
+        """
+        Initialize a registry with no actors.
+        """
+
+        self._actors = {}
+        self._movers = []
+        self._mover_places = []
+        self._places = {}
+        self._next_place = 0
+        self._removed = set()
+        self._wheel = TickWheel()
+
+    def __len__(self) -> int:
+        """
+        Return the number of actors in the registry.
+        """
+
+        return len(self._actors)
+
+    def __iter__(self) -> Iterator[Actor]:
+        """
+        Return an iterator over the actors in the registry, in the order they
+        were added.
+        """
+
+        return iter(self._actors)
+
+    def __contains__(self, actor: object) -> bool:
+        """
+        Return True iff <actor> is in the registry.
+        """
+
+        return actor in self._actors
+
+    def get_actors(self) -> List[Actor]:
+        """
+        Return a new list of the actors in the registry, in the order they
+        were added.
+        """
+
+        return list(self._actors)
+
+    def add(self, actor: Actor) -> None:
+        """
+        Add the given <actor>, which moves after every actor already added,
+        unless it was removed and has not been taken out of the order actors
+        move in yet, in which case it keeps its old place. A scheduled actor
+        does not move until it is scheduled.
+        """
+
+        self._actors[actor] = None
+        if actor in self._removed:
+            self._removed.discard(actor)
+        elif actor.scheduled:
+            self._places[actor] = self._next_place
+            self._next_place += 1
+        elif not actor.idle:
+            self._movers.append(actor)
+            self._mover_places.append(self._next_place)
+            self._next_place += 1
+
+    def add_all(self, actors: Iterable[Actor]) -> None:
+        """
+        Add each of the given <actors> in order, none of which have been in
+        the registry before, the same as calling add for each of them.
+        """
+
+        for actor in actors:
+            self.add(actor)
+
+    def remove(self, actor: Actor) -> None:
+        """
+        Remove the given <actor>, which must be in the registry.
+        """
+
+        del self._actors[actor]
+        if actor.scheduled:
+            self._places.pop(actor, None)
+            self._wheel.cancel(actor)
+        elif not actor.idle:
+            self._removed.add(actor)
+
+    def schedule(self, mover, ticks: int) -> None:
+        """
+        Move the given <mover>, a scheduled actor in the registry or a thing
+        that moves in the place of some, on the tick <ticks> ticks after the
+        current one (1 for the next tick), and not before.
+        """
+
+        self._wheel.schedule(mover, ticks)
+
+    def get_waits(self) -> Dict[Actor, int]:
+        """
+        Return a map from each scheduled actor that is to move again to the
+        number of ticks after the current one it moves on.
+        """
+
+        actors = self._actors
+        return {actor: ticks for actor, ticks in self._wheel.get_waits().items()
+                if actor in actors}
+
+    def get_tick(self) -> int:
+        """
+        Return the number of ticks started (see movers).
+        """
+
+        return self._wheel.get_tick()
+
+    def movers(self) -> Iterator:
+        """
+        Start the next tick, and return an iterator over what moves on it, in
+        order. Actors removed while this is iterated over are skipped, and
+        actors added while it is are moved at the end of it.
+        """
+
+        due = self._wheel.advance()
+        if not due:
+            return filterfalse(self._removed.__contains__, self._movers)
+        return self._merge(due)
+
+    def end_tick(self) -> None:
+        """
+        Finish a tick, taking the removed actors out of the order actors move
+        in if they make up half of it. Taking them out only then means each
+        removal pays for a fixed share of the work.
+        """
+
+        if len(self._removed) * 2 >= len(self._movers) > 0:
+            self._take_out_removed()
+
+    def get_active(self) -> List[Actor]:
+        """
+        Return a new list of the active actors in the registry, in the order
+        they were added.
+        """
+
+        return [actor for actor in self._actors if not actor.idle]
+
+    def set_movers(self, movers: List) -> None:
+        """
+        Make <movers> what moves, in order: the active actors, with anything
+        that moves in place of some of them. An iterator returned by movers()
+        before this is called goes on with the old order.
+
+        Scheduled actors, and things that move in the place of some, are
+        then no longer scheduled, and do not move until they are scheduled
+        again, even if they were due on this tick and have not moved yet.
+        """
+
+        self._movers, self._mover_places = [], []
+        self._places = {}
+        for place, mover in enumerate(movers):
+            if mover.scheduled:
+                self._places[mover] = place
+            else:
+                self._movers.append(mover)
+                self._mover_places.append(place)
+        self._next_place = len(movers)
+        self._removed = set()
+        self._wheel.clear()
+
+    def _merge(self, due: List) -> Iterator:
+        """
+        Yield what moves on this tick, in order: the things that move on
+        every tick, with the scheduled things <due> on this tick in their
+        places among them.
+        """
+
+        places = self._places
+        due.sort(key=places.__getitem__)
+        movers, mover_places = self._movers, self._mover_places
+        skip = self._removed.__contains__
+        is_due = self._wheel.is_due
+        start = 0
+        for mover in due:
+            # A scheduled actor removed earlier in the tick has no place
+            place = places.get(mover)
+            if place is None:
+                continue
+            end = bisect_left(mover_places, place, start)
+            if end > start:
+                yield from filterfalse(skip, movers[start:end])
+                start = end
+            if is_due(mover):
+                yield mover
+        yield from filterfalse(skip, islice(movers, start, None))
+
+    def _take_out_removed(self) -> None:
+        """
+        Take the removed actors out of the order actors move in.
+        """
+
+        removed = self._removed
+        kept = [(mover, place) for mover, place
+                in zip(self._movers, self._mover_places) if mover not in removed]
+        self._movers = [mover for mover, _ in kept]
+        self._mover_places = [place for _, place in kept]
+        self._removed = set()
@@ -0,0 +1,339 @@
+"""
+This module contains the renderer that draws the game's stage onto the
+screen, redrawing only the parts of the screen that changed.
+"""
+
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import pygame
+from actors2 import *
+from spatial import SpatialIndex
+from assets import ASSETS
+from hud import Hud
+
+# The number of tiles across and down each chunk of static tiles drawn ahead
+# of time
+CHUNK_TILES = 16
+
+# The most chunks kept drawn at once, which is a few screens' worth
+MAX_CHUNKS = 24
+
+# The closest, in tiles, the player comes to the edge of the view before the
+# camera follows them
+CAMERA_MARGIN = 5
+
+
+class Renderer:
+    """
+    A class that draws a level onto the screen.
+
+    The screen shows a view of the stage, no bigger than MAX_VIEW_WIDTH x
+    MAX_VIEW_HEIGHT tiles, through a camera that follows the player: the
+    camera only moves when the player comes within CAMERA_MARGIN tiles of
+    the edge of the view, and never shows anything beyond the stage.
+
+    The static tiles are drawn ahead of time in chunks of CHUNK_TILES x
+    CHUNK_TILES tiles, kept for as long as they are in use, so the
+    background of the view is only a few chunks copied into place when the
+    camera moves. Only the actors filed in the tiles in view are drawn, so
+    drawing a frame takes the same time however big the stage is.
+
+    While the camera is still, each frame only redraws the cells where
+    actors were added, removed or moved (and the HUD if its counters
+    changed), and only those rectangles are pushed to the display.
+
+    The simulation runs fewer ticks per second than frames are drawn, so
+    each actor that moved in the last tick is drawn part of the way from
+    where it was to where it is, according to how far the game is through
+    the time until the next tick. Motion then looks smooth at any frame
+    rate. Positions are worked out in whole steps of 1 / SUBTILE of a tile,
+    and only turned into pixels when drawn.
+
+    === Private Attributes ===
+    _screen:
+        the Surface the game is displayed on
+    _background:
+        the static tiles in view and the level's HUD
+    _index:
+        the spatial index of the level the background was drawn for
+    _hud:
+        the HUD drawn into the background
+    _view:
+        the width and height of the view of the stage shown on the screen,
+        in tiles
+    _camera:
+        the position of the top left corner of the view on the stage, in
+        steps of 1 / SUBTILE of a tile
+    _chunks:
+        map from the position of each chunk of static tiles that has been
+        drawn (counting in chunks) to its Surface, least recently used first
+    _drawn:
+        map from each actor drawn part of the way along its last move in the
+        last frame to where it was drawn, in steps of 1 / SUBTILE of a tile
+    """
+    _screen: pygame.Surface
+    _background: Optional[pygame.Surface]
+    _index: Optional[SpatialIndex]
+    _hud: Hud
+    _view: Tuple[int, int]
+    _camera: Tuple[int, int]
+    _chunks: OrderedDict
+    _drawn: Dict[Actor, Tuple[int, int]]
+
+    def __init__(self, screen: pygame.Surface) -> None:
+        """
+        Initialize a renderer that draws onto the given <screen>.
+        """
+
+        self._screen = screen
+        self._background = None
+        self._index = None
+        self._hud = Hud()
+        self._view = (screen.get_width() // ICON_SIZE,
+                      screen.get_height() // ICON_SIZE - 1)
+        self._camera = (0, 0)
+        self._chunks = OrderedDict()
+        self._drawn = {}
+
+    def render(self, game: 'Game', alpha: float = 1.0) -> None:
+        """
+        Draw the current state of the <game> onto the screen, with the
+        actors that moved in the last tick drawn the fraction <alpha> of the
+        way from where they were to where they are.
+        """
+
+        index = game.get_spatial_index()
+        if index is not self._index:
+            self._draw_level(game, alpha)
+            return
+
+        drawn = self._interpolate(alpha)
+        camera = self._follow(game, drawn)
+        if camera != self._camera:
+            self._camera = camera
+            self._drawn = drawn
+            self._draw_view()
+            return
+
+        dirty = self._draw_changes(drawn)
+        row = self._hud.draw(game, self._background)
+        if row is not None:
+            self._screen.blit(self._background, row, row)
+            dirty.append(row)
+        if dirty:
+            pygame.display.update(dirty)
+
+    def redraw(self) -> None:
+        """
+        Draw the whole view again on the next render, e.g. after something
+        else has been drawn over it.
+        """
+
+        self._index = None
+
+    def _follow(self, game: 'Game',
+                drawn: Dict[Actor, Tuple[int, int]]) -> Tuple[int, int]:
+        """
+        Return where the camera is with the <game>'s player drawn where they
+        are in <drawn>, or where they are if they are not in it: moved just
+        far enough to keep the player CAMERA_MARGIN tiles from the edge of
+        the view, and kept inside the stage.
+        """
+
+        camera = self._camera
+        if game.player is None:
+            return camera
+
+        position = drawn.get(game.player) or game.player.get_subtile_position()
+        stage = (game.stage_width, game.stage_height)
+        followed = []
+        for axis in (0, 1):
+            view = self._view[axis]
+            margin = min(CAMERA_MARGIN, (view - 1) // 2) * SUBTILE
+            low = position[axis] - margin
+            high = position[axis] + SUBTILE + margin - view * SUBTILE
+            corner = min(max(camera[axis], high), low)
+            corner = min(corner, (stage[axis] - view) * SUBTILE)
+            followed.append(max(corner, 0))
+        return followed[0], followed[1]
+
+    def _draw_level(self, game: 'Game', alpha: float) -> None:
+        """
+        Start drawing the <game>'s current level, with the actors that moved
+        in the last tick the fraction <alpha> of the way along, and draw the
+        whole view and the HUD onto the screen.
+        """
+
+        self._index = game.get_spatial_index()
+        self._chunks.clear()
+        self._background = pygame.Surface(self._screen.get_size()).convert()
+        self._background.fill(BLACK)
+        self._hud.reset()
+        self._hud.draw(game, self._background)
+        self._drawn = self._interpolate(alpha)
+        self._camera = self._follow(game, self._drawn)
+        self._draw_view()
+
+    def _draw_view(self) -> None:
+        """
+        Draw the static tiles in view into the background, then draw the
+        whole view onto the screen.
+        """
+
+        self._index.track_changes()
+        stage = self._stage_rect()
+        self._background.set_clip(stage)
+        self._background.fill(BLACK)
+        left, top, right, bottom = self._tiles_in_view()
+        chunk_size = CHUNK_TILES * SUBTILE
+        for chunk_y in range(top // CHUNK_TILES, bottom // CHUNK_TILES + 1):
+            for chunk_x in range(left // CHUNK_TILES,
+                                 right // CHUNK_TILES + 1):
+                self._background.blit(
+                    self._chunk(chunk_x, chunk_y),
+                    self._subtile_rect(chunk_x * chunk_size,
+                                       chunk_y * chunk_size))
+        self._background.set_clip(None)
+
+        self._screen.blit(self._background, (0, 0))
+
+        # An actor can be drawn up to a tile away from its own tile when it
+        # is part way along a move
+        self._screen.set_clip(stage)
+        actors = self._index.get_in_area(left - 1, top - 1, right + 1,
+                                         bottom + 1)
+        actors.sort(key=self._index.order_of)
+        for a in actors:
+            self._screen.blit(a.icon, self._actor_rect(a))
+        self._screen.set_clip(None)
+
+        pygame.display.flip()
+
+    def _draw_changes(self, drawn: Dict[Actor, Tuple[int, int]]
+                      ) -> List[pygame.Rect]:
+        """
+        Redraw the cells where actors were added, removed or moved since the
+        last frame, and where the actors that moved in the last tick were
+        and are now drawn, with them drawn where they are in <drawn>. Return
+        the rectangles that were redrawn.
+        """
+
+        # An actor that stops being drawn part way is redrawn where it is
+        changes = self._index.pop_changes()
+        for actor, position in self._drawn.items():
+            changes.append(position)
+            if actor not in drawn:
+                changes.append(actor.get_subtile_position())
+        changes.extend(drawn.values())
+        self._drawn = drawn
+
+        dirty = []
+        stage = self._stage_rect()
+        for x, y in changes:
+            rect = self._subtile_rect(x, y).clip(stage)
+            if not rect:
+                continue
+            dirty.append(rect)
+
+            # An actor can overlap this rectangle from up to two tiles away
+            # when it is part way between tiles and part way along a move
+            tile_x, tile_y = x // SUBTILE, y // SUBTILE
+            nearby = [a for a in self._index.get_in_area(
+                tile_x - 2, tile_y - 2, tile_x + 2, tile_y + 2)
+                if rect.colliderect(self._actor_rect(a))]
+            nearby.sort(key=self._index.order_of)
+
+            self._screen.set_clip(rect)
+            self._screen.blit(self._background, rect, rect)
+            for a in nearby:
+                self._screen.blit(a.icon, self._actor_rect(a))
+        self._screen.set_clip(None)
+
+        return dirty
+
+    def _chunk(self, chunk_x: int, chunk_y: int) -> pygame.Surface:
+        """
+        Return the Surface with the static tiles of the chunk at <chunk_x>
+        and <chunk_y> (counting in chunks) drawn on it, drawing it if it has
+        not been drawn or has been dropped to make room for others.
+        """
+
+        key = (chunk_x, chunk_y)
+        chunk = self._chunks.get(key)
+        if chunk is not None:
+            self._chunks.move_to_end(key)
+            return chunk
+
+        size = CHUNK_TILES * ICON_SIZE
+        chunk = pygame.Surface((size, size)).convert()
+        chunk.fill(BLACK)
+        left, top = chunk_x * CHUNK_TILES, chunk_y * CHUNK_TILES
+        for y in range(top, top + CHUNK_TILES):
+            for x in range(left, left + CHUNK_TILES):
+                tile = self._index.get_static(x, y)
+                if tile:
+                    chunk.blit(ASSETS.get_icon(STATIC_TILES[tile][1]),
+                               ((x - left) * ICON_SIZE, (y - top) * ICON_SIZE))
+
+        self._chunks[key] = chunk
+        if len(self._chunks) > MAX_CHUNKS:
+            self._chunks.popitem(last=False)
+        return chunk
+
+    def _interpolate(self, alpha: float) -> Dict[Actor, Tuple[int, int]]:
+        """
+        Return a map from each actor that moved in the last tick to where it
+        is drawn, the fraction <alpha> of the way from where it was to where
+        it is. Actors that moved more than a tile on either axis (e.g.
+        pushed back from a door) are drawn where they are, so they are left
+        out.
+        """
+
+        drawn = {}
+        for actor, (from_x, from_y) in self._index.get_motions().items():
+            to_x, to_y = actor.get_subtile_position()
+            if abs(to_x - from_x) <= SUBTILE and abs(to_y - from_y) <= SUBTILE:
+                drawn[actor] = (from_x + int((to_x - from_x) * alpha),
+                                from_y + int((to_y - from_y) * alpha))
+        return drawn
+
+    def _tiles_in_view(self) -> Tuple[int, int, int, int]:
+        """
+        Return the left, top, right and bottom tiles (inclusive) that are at
+        least partly in view.
+        """
+
+        left, top = self._camera
+        right = left + self._view[0] * SUBTILE - 1
+        bottom = top + self._view[1] * SUBTILE - 1
+        return (left // SUBTILE, top // SUBTILE, right // SUBTILE,
+                bottom // SUBTILE)
+
+    def _actor_rect(self, actor: Actor) -> pygame.Rect:
+        """
+        Return the rectangle on the screen the <actor> is drawn in.
+        """
+
+        x, y = self._drawn.get(actor) or actor.get_subtile_position()
+        return self._subtile_rect(x, y)
+
+    def _subtile_rect(self, x: int, y: int) -> pygame.Rect:
+        """
+        Return the rectangle on the screen covered by a tile at <x> and <y>
+        on the stage, in steps of 1 / SUBTILE of a tile.
+        """
+
+        return pygame.Rect((x - self._camera[0]) * ICON_SIZE // SUBTILE,
+                           (y - self._camera[1]) * ICON_SIZE // SUBTILE,
+                           ICON_SIZE, ICON_SIZE)
+
+    def _stage_rect(self) -> pygame.Rect:
+        """
+        Return the rectangle on the screen covered by the view of the stage,
+        above the HUD.
+        """
+
+        stage = self._screen.get_rect()
+        stage.height -= ICON_SIZE
+        return stage
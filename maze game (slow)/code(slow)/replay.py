@@ -0,0 +1,418 @@
+"""
+This module records the input of a game session, so that the session can be
+played out again exactly, and replays recorded sessions headless as fast as
+possible.
+
+A replay can seek to any tick of a session. It takes a snapshot of the game
+every so many ticks as it plays, and seeks by restoring the nearest snapshot
+before the tick and playing on from there, rather than from the start.
+
+Record a session by playing the game, e.g.:
+    python replay.py record session.rec
+and replay it, e.g.:
+    python replay.py play session.rec --seek 5000
+"""
+
+from __future__ import annotations
+import os
+
+# Keep pygame's greeting out of the output of replays. This must be set
+# before pygame is imported.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import json
+import random
+import struct
+from typing import Dict, List, Optional
+import pygame
+from game2 import Game, LEVEL_MAPS
+from inputs import InputSource, KeyboardInput, KeyState
+from mazegen import MazeSpec
+from settings import TICK_RATE
+
+# The keys the player reacts to, in the order of the bits that record them
+PLAYER_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN,
+               pygame.K_a, pygame.K_d, pygame.K_w, pygame.K_s)
+
+# The player only tells other keys apart from the player keys, so any other
+# key pressed is recorded as, and replayed as, this one
+_OTHER_KEY = pygame.K_SPACE
+_OTHER_EVENT = len(PLAYER_KEYS) + 1
+
+# The number of ticks between the snapshots a replay takes
+SNAPSHOT_INTERVAL = 500
+
+# The header of a session file: magic bytes, format version and the length
+# of the session's settings, which follow as JSON. Version 1 sessions were
+# recorded when a seed placed actors differently, so they cannot be replayed.
+_HEADER = struct.Struct("<4sHI")
+_MAGIC = b"MAZR"
+_VERSION = 2
+
+
+class Session:
+    """
+    The recorded input of a game, and what is needed to start the game again
+    the same way.
+
+    === Public Attributes ===
+    seed:
+        the seed of the random numbers the game placed actors with
+    level:
+        the level the game started at
+    level_maps:
+        the map of each level, as map file names or MazeSpecs
+    tick_rate:
+        the number of ticks the game ran per second
+    batch_monsters:
+        whether the game moved its squishy monsters in a swarm
+    inputs:
+        two bytes for each tick: the last key the player was told about
+        (0 for none, or 1 more than its place in PLAYER_KEYS), and a bit for
+        each key in PLAYER_KEYS that was held
+    """
+    seed: int
+    level: int
+    level_maps: List
+    tick_rate: int
+    batch_monsters: bool
+    inputs: bytearray
+
+    def __init__(self, seed: int, level: int = 0,
+                 level_maps: Optional[List] = None,
+                 tick_rate: int = TICK_RATE,
+                 batch_monsters: bool = False) -> None:
+        """
+        Initialize a session with no input yet, for a game started at
+        <level> with the given <seed>.
+        """
+
+        self.seed = seed
+        self.level = level
+        self.level_maps = list(level_maps if level_maps is not None
+                               else LEVEL_MAPS)
+        self.tick_rate = tick_rate
+        self.batch_monsters = batch_monsters
+        self.inputs = bytearray()
+
+    def __len__(self) -> int:
+        """
+        Return the number of ticks recorded.
+        """
+
+        return len(self.inputs) // 2
+
+    def new_game(self, input_source: InputSource,
+                 headless: bool = True) -> Game:
+        """
+        Return a new game set up the same way as the session's game, that
+        reads its keys from <input_source>.
+        """
+
+        return Game(tick_rate=self.tick_rate, headless=headless,
+                    input_source=input_source, level=self.level,
+                    level_maps=self.level_maps,
+                    batch_monsters=self.batch_monsters, seed=self.seed)
+
+    def save(self, filename: str) -> None:
+        """
+        Write this session to the file <filename>.
+        """
+
+        level_maps = []
+        for level_map in self.level_maps:
+            if isinstance(level_map, MazeSpec):
+                level_maps.append({"maze": [level_map.width, level_map.height,
+                                            level_map.seed, level_map.monsters,
+                                            level_map.openness]})
+            elif isinstance(level_map, str):
+                level_maps.append(level_map)
+            else:
+                raise ValueError("Cannot save the level map {!r}"
+                                 .format(level_map))
+
+        settings = json.dumps({
+            "seed": self.seed, "level": self.level, "level_maps": level_maps,
+            "tick_rate": self.tick_rate,
+            "batch_monsters": self.batch_monsters}).encode()
+        with open(filename, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(settings)))
+            f.write(settings)
+            f.write(self.inputs)
+
+    @staticmethod
+    def load(filename: str) -> Session:
+        """
+        Return the session in the file <filename>, as written by save.
+        """
+
+        with open(filename, "rb") as f:
+            data = f.read()
+        magic, version, length = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("{} is not a session file".format(filename))
+
+        start = _HEADER.size
+        settings = json.loads(data[start:start + length].decode())
+        level_maps = [MazeSpec(*level_map["maze"]) if isinstance(level_map, dict)
+                      else level_map for level_map in settings["level_maps"]]
+        session = Session(settings["seed"], settings["level"], level_maps,
+                          settings["tick_rate"], settings["batch_monsters"])
+        session.inputs = bytearray(data[start + length:])
+        return session
+
+
+class RecordingInput(InputSource):
+    """
+    An input source that passes on the keys from another input source, and
+    records them in a session.
+
+    === Public Attributes ===
+    session:
+        the session the input is recorded in
+
+    === Private Attributes ===
+    _source:
+        the input source the keys come from
+    """
+    session: Session
+    _source: InputSource
+
+    def __init__(self, source: InputSource, session: Session) -> None:
+        """
+        Initialize an input source that records the keys from <source> in
+        <session>.
+        """
+
+        self._source = source
+        self.session = session
+
+    def poll(self, game: 'Game') -> KeyState:
+        """
+        Return the keys from the source on the <game>'s current tick, and
+        record them along with the last key the player was told about.
+        """
+
+        keys = self._source.poll(game)
+        event = game.player.get_last_event() if game.player is not None else None
+        held = 0
+        for bit, key in enumerate(PLAYER_KEYS):
+            if keys[key]:
+                held |= 1 << bit
+        self.session.inputs += bytes((_event_code(event), held))
+        return keys
+
+
+class ReplayInput(InputSource):
+    """
+    An input source that plays back the input recorded in a session.
+
+    === Public Attributes ===
+    tick:
+        the tick of the session the next poll plays back
+
+    === Private Attributes ===
+    _inputs:
+        the recorded input
+    """
+    tick: int
+    _inputs: bytes
+
+    def __init__(self, session: Session) -> None:
+        """
+        Initialize an input source that plays back <session> from its start.
+        """
+
+        self._inputs = bytes(session.inputs)
+        self.tick = 0
+
+    def poll(self, game: 'Game') -> KeyState:
+        """
+        Tell the <game>'s player about the key recorded for this tick, and
+        return the keys recorded as held. No keys are held once the session
+        has run out.
+        """
+
+        i = self.tick * 2
+        self.tick += 1
+        if i >= len(self._inputs):
+            return KeyState()
+
+        event, held = self._inputs[i], self._inputs[i + 1]
+        if game.player is not None:
+            game.player.register_event(_event_key(event))
+        return KeyState(key for bit, key in enumerate(PLAYER_KEYS)
+                        if held & (1 << bit))
+
+
+class Replay:
+    """
+    A headless replay of a recorded session, which can seek to any tick.
+
+    === Public Attributes ===
+    session:
+        the session being replayed
+    game:
+        the game the session is replayed in
+
+    === Private Attributes ===
+    _input:
+        the input source playing back the session
+    _interval:
+        the number of ticks between snapshots
+    _snapshots:
+        map from each tick a snapshot has been taken at to the snapshot,
+        taken before that tick ran
+    """
+    session: Session
+    game: Game
+    _input: ReplayInput
+    _interval: int
+    _snapshots: Dict[int, bytes]
+
+    def __init__(self, session: Session,
+                 interval: int = SNAPSHOT_INTERVAL) -> None:
+        """
+        Initialize a replay of <session> at its first tick, which takes a
+        snapshot every <interval> ticks.
+        """
+
+        self.session = session
+        self._input = ReplayInput(session)
+        self.game = session.new_game(self._input)
+        self.game.on_init()
+        self._interval = interval
+        self._snapshots = {}
+
+    def get_tick(self) -> int:
+        """
+        Return the number of ticks that have been replayed.
+        """
+
+        return self._input.tick
+
+    def step(self) -> bool:
+        """
+        Replay the next tick, and return True, unless the game has ended or
+        the session has run out, in which case return False.
+        """
+
+        tick = self._input.tick
+        if not self.game.is_running() or tick >= len(self.session):
+            return False
+        if tick % self._interval == 0 and tick not in self._snapshots:
+            self._snapshots[tick] = self.game.snapshot()
+        self.game.on_loop()
+        return True
+
+    def seek(self, tick: int) -> int:
+        """
+        Replay up to the given <tick>, so that <tick> ticks have run, going
+        back to an earlier snapshot first if that is quicker. Stop early if
+        the game ends. Return the number of ticks that have been replayed.
+        """
+
+        tick = max(0, min(tick, len(self.session)))
+        snapshot_tick = tick // self._interval * self._interval
+        while snapshot_tick > 0 and snapshot_tick not in self._snapshots:
+            snapshot_tick -= self._interval
+        if snapshot_tick in self._snapshots and \
+                (tick < self._input.tick or snapshot_tick > self._input.tick):
+            self.game.restore(self._snapshots[snapshot_tick])
+            self._input.tick = snapshot_tick
+
+        while self._input.tick < tick and self.step():
+            pass
+        return self._input.tick
+
+    def run(self) -> Optional[str]:
+        """
+        Replay the rest of the session, and return "won" or "lost" if the
+        game ended that way, or None if the session ran out first.
+        """
+
+        while self.step():
+            pass
+        return self.game.get_outcome()
+
+
+def record(filename: str, level: int = 0,
+           seed: Optional[int] = None) -> Session:
+    """
+    Play the game from <level>, and record the session to <filename>. The
+    actors are placed with random numbers from <seed>, or a new random seed
+    if it is None. Return the session.
+    """
+
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    session = Session(seed, level)
+    game = session.new_game(RecordingInput(KeyboardInput(), session),
+                            headless=False)
+    game.on_execute()
+    session.save(filename)
+    return session
+
+
+def _event_code(key: Optional[int]) -> int:
+    """
+    Return the number a key event is recorded as.
+    """
+
+    if not key:
+        return 0
+    if key in PLAYER_KEYS:
+        return PLAYER_KEYS.index(key) + 1
+    return _OTHER_EVENT
+
+
+def _event_key(code: int) -> Optional[int]:
+    """
+    Return the key a recorded key event is played back as.
+    """
+
+    if code == 0:
+        return None
+    if code == _OTHER_EVENT:
+        return _OTHER_KEY
+    return PLAYER_KEYS[code - 1]
+
+
+def main() -> None:
+    """
+    Record or replay a session, as given on the command line.
+    """
+
+    parser = argparse.ArgumentParser(description="Record and replay games.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    recording = commands.add_parser("record", help="play and record a session")
+    recording.add_argument("file")
+    recording.add_argument("--level", type=int, default=0)
+    recording.add_argument("--seed", type=int, default=None)
+    playing = commands.add_parser("play", help="replay a session headless")
+    playing.add_argument("file")
+    playing.add_argument("--seek", type=int, default=None,
+                         help="stop at this tick, rather than the end")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        session = record(args.file, args.level, args.seed)
+        print("Recorded {} ticks to {}".format(len(session), args.file))
+        return
+
+    replay = Replay(Session.load(args.file))
+    if args.seek is not None:
+        replay.seek(args.seek)
+    else:
+        replay.run()
+    game = replay.game
+    player = game.player
+    print("tick {} of {}: level {}, outcome {}, player at {}".format(
+        replay.get_tick(), len(replay.session), game.get_level(),
+        game.get_outcome(),
+        (player.x, player.y) if player is not None else None))
+
+
+if __name__ == "__main__":
+    main()
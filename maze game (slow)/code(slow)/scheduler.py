@@ -0,0 +1,134 @@
+"""
+This module contains the tick wheel, which keeps what is due to move on each
+of the coming ticks of a game, so that a tick only looks at what is due on
+it.
+"""
+
+from __future__ import annotations
+from typing import Dict, Hashable, List, Set
+
+# The number of slots around the wheel, one for each of the coming ticks;
+# anything due further ahead than this goes round the wheel more than once
+WHEEL_SLOTS = 64
+
+
+class TickWheel:
+    """
+    A timing wheel: a ring of WHEEL_SLOTS slots, one for each of the coming
+    ticks, holding the items due on that tick.
+
+    Scheduling and cancelling an item take the same time however many items
+    are scheduled, and advancing to the next tick only looks at the items in
+    its slot, so an item costs nothing on the ticks it is not due on.
+
+    An item cancelled or scheduled again is left in the slot it was in, and
+    dropped when that slot comes round, so neither has to search a slot. An
+    item is only taken from its slot on the tick it is due on, so each item
+    in a slot is checked against the tick it is due on, and kept there if
+    that is a later time round the wheel.
+
+    === Private Attributes ===
+    _tick:
+        the number of ticks the wheel has advanced
+    _slots:
+        the items scheduled in each slot; an item due on tick t is in slot
+        t % WHEEL_SLOTS, and may be in it more than once
+    _due:
+        map from each item that is scheduled to the tick it is due on
+    _now:
+        the items due on the current tick that have not been cancelled or
+        scheduled again
+    """
+    _tick: int
+    _slots: List[List[Hashable]]
+    _due: Dict[Hashable, int]
+    _now: Set[Hashable]
+
+    def __init__(self) -> None:
+        """
+        Initialize a wheel with nothing scheduled, at tick 0.
+        """
+
+        self._tick = 0
+        self._slots = [[] for _ in range(WHEEL_SLOTS)]
+        self._due = {}
+        self._now = set()
+
+    def get_tick(self) -> int:
+        """
+        Return the number of ticks the wheel has advanced.
+        """
+
+        return self._tick
+
+    def schedule(self, item: Hashable, ticks: int) -> None:
+        """
+        Make the given <item> due on the tick <ticks> ticks after the current
+        one, instead of when it was due before. <ticks> must be at least 1.
+        """
+
+        due = self._tick + ticks
+        self._due[item] = due
+        self._now.discard(item)
+        self._slots[due % WHEEL_SLOTS].append(item)
+
+    def cancel(self, item: Hashable) -> None:
+        """
+        Make the given <item> no longer due, if it was scheduled.
+        """
+
+        self._due.pop(item, None)
+        self._now.discard(item)
+
+    def clear(self) -> None:
+        """
+        Make nothing due, without going back to tick 0.
+        """
+
+        self._slots = [[] for _ in range(WHEEL_SLOTS)]
+        self._due = {}
+        self._now = set()
+
+    def is_due(self, item: Hashable) -> bool:
+        """
+        Return True iff the given <item> is due on the current tick, and has
+        not been cancelled or scheduled again since the wheel advanced to it.
+        """
+
+        return item in self._now
+
+    def get_waits(self) -> Dict[Hashable, int]:
+        """
+        Return a map from each item that is scheduled to the number of ticks
+        after the current one it is due on.
+        """
+
+        tick = self._tick
+        return {item: due - tick for item, due in self._due.items()}
+
+    def advance(self) -> List[Hashable]:
+        """
+        Advance to the next tick, and return a new list of the items due on
+        it, which are no longer scheduled.
+        """
+
+        self._tick += 1
+        tick = self._tick
+        slot = self._slots[tick % WHEEL_SLOTS]
+        if not slot and not self._now:
+            return []
+
+        # An item in the slot more than once is only due the first time
+        due, later = [], []
+        scheduled = self._due
+        for item in slot:
+            item_tick = scheduled.get(item)
+            if item_tick == tick:
+                del scheduled[item]
+                due.append(item)
+            elif item_tick is not None and item_tick > tick and \
+                    item_tick % WHEEL_SLOTS == tick % WHEEL_SLOTS:
+                later.append(item)
+        self._slots[tick % WHEEL_SLOTS] = later
+        self._now = set(due)
+        return due
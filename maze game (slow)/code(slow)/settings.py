@@ -4,3 +4,39 @@ BLACK = (0, 0, 0)
 
 # Global variable used for sizing
 ICON_SIZE = 24
+
+# The kinds of static tile a level's stage is made of
+EMPTY, WALL, DOOR = 0, 1, 2
+
+# The kinds of the other actors, used to tell what is in a tile without
+# looking at the actor
+BOX, STAR, KEY, MONSTER, PLAYER, OTHER = 3, 4, 5, 6, 7, 8
+
+# The most tiles the window shows across and down; bigger stages are shown
+# through a camera that scrolls to follow the player
+MAX_VIEW_WIDTH = 40
+MAX_VIEW_HEIGHT = 30
+
+# Global variables used for the heads-up display
+HUD_FONT = 'freesansbold.ttf'
+HUD_FONT_SIZE = 9
+
+# Global variables used for timing the game loop, in ticks or frames per
+# second. A RENDER_RATE of 0 renders as often as possible.
+TICK_RATE = 10
+RENDER_RATE = 60
+
+# The most simulation ticks run back to back to catch up after a slow frame
+MAX_CATCH_UP_TICKS = 5
+
+# The number of stars and boxes placed at random on the levels that have them
+STAR_COUNT = 7
+BOX_COUNT = 12
+
+# The number of steps a tile is divided into, so that an actor part way
+# between two tiles still has a position in whole numbers
+SUBTILE = 256
+
+# Global variables for monster speeds, in real time
+GHOST_SPEED = 1.25  # tiles per second
+SQUISHY_STEP_TIME = 0.5  # seconds between steps
@@ -0,0 +1,480 @@
+"""
+This module contains the spatial index the game uses to find the actors
+at a location on the stage without scanning every actor.
+"""
+
+from __future__ import annotations
+from bisect import bisect_right
+from collections.abc import Sequence
+from itertools import compress, islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from settings import EMPTY, SUBTILE
+
+# Maps each kind of tile to 1 if it is EMPTY and to 0 otherwise
+_EMPTY_TABLE = bytes([1]) + bytes(255)
+
+
+class SpatialIndex:
+    """
+    A grid of cells that maps each integer tile of the stage to the actors
+    occupying it. A cell can hold more than one actor (e.g. the player
+    standing on a door), so each cell keeps its actors in the order they were
+    added to the game. This keeps get() returning the same actor that a scan
+    of the game's actor list would have found first.
+
+    Actors part way between two tiles (e.g. a ghost, see Actor.sub_x) are
+    filed under their tile, but lookups only find actors exactly on a tile.
+
+    Tiles that never move or leave the stage (walls and doors) are not kept
+    as actors at all. They are stored as a byte per tile, and an actor is
+    only made for one when it is looked up. Static tiles come before every
+    other actor in their cell, as they are the first thing a level adds.
+
+    The index also keeps the kind (see settings) of the first actor in each
+    tile of the stage, static or not, in a byte per tile that is updated
+    whenever an actor is added, removed or moved. This tells what is in a
+    tile with a single read, without finding the actor.
+
+    === Public Attributes ===
+    width:
+        the number of tiles across the stage
+    height:
+        the number of tiles down the stage
+
+    === Private Attributes ===
+    _cells:
+        map from the number of a tile of the stage (counting row by row) to
+        the actors in that tile, holding only tiles that have actors
+    _outside:
+        map from a tile off the stage to the actors in that tile
+    _static:
+        the kind of static tile at each tile of the stage, row by row, or 0
+        where there is none; this may be a read-only view of a level file
+    _kinds:
+        the kind of the actor get() returns for each tile of the stage, row
+        by row, or EMPTY where it returns None
+    _make_static:
+        the function that makes an actor for a kind of static tile at a
+        position
+    _order:
+        map from each actor in the index to the order it was added in
+    _next_order:
+        the order number the next actor added will get
+    _changes:
+        the positions, in steps of 1 / SUBTILE of a tile, actors have been
+        added to, removed from or moved out of or into since the changes
+        were last popped, or None if changes are not being tracked
+    _motions:
+        map from each actor moved since motions were last started to its
+        position then, in steps of 1 / SUBTILE of a tile, or None if
+        motions are not being tracked
+    _watcher:
+        the collision tracker told about every actor added, removed or
+        moved, or None
+    """
+    width: int
+    height: int
+    _cells: Dict[int, List['Actor']]
+    _outside: Dict[Tuple[int, int], List['Actor']]
+    _static: Union[bytearray, memoryview]
+    _kinds: bytearray
+    _make_static: Callable[[int, int, int], 'Actor']
+    _order: Dict['Actor', int]
+    _next_order: int
+    _changes: Optional[List[Tuple[int, int]]]
+    _motions: Optional[Dict['Actor', Tuple[int, int]]]
+    _watcher: Optional['CollisionTracker']
+
+    def __init__(self, width: int, height: int,
+                 make_static: Callable[[int, int, int], 'Actor'],
+                 static: Union[bytearray, memoryview, None] = None) -> None:
+        """
+        Initialize an empty spatial index for a stage <width> tiles across
+        and <height> tiles down, which uses <make_static> to make the actor
+        for a static tile when one is looked up.
+
+        The stage's static tiles are given by <static>, which is used as-is
+        rather than copied, or are all empty if it is None.
+        """
+
+        self.width, self.height = width, height
+        self._cells = {}
+        self._outside = {}
+        if static is None:
+            static = bytearray(width * height)
+        self._static = static
+        self._kinds = bytearray(static)
+        self._make_static = make_static
+        self._order = {}
+        self._next_order = 0
+        self._changes = None
+        self._motions = None
+        self._watcher = None
+
+    def add(self, actor: 'Actor') -> None:
+        """
+        Add the given <actor> to the cell at its current position.
+        """
+
+        self._order[actor] = self._next_order
+        self._next_order += 1
+        self._insert(actor, actor.x, actor.y)
+        self._update_kind(actor.x, actor.y)
+        if self._changes is not None:
+            self._changes.append(actor.get_subtile_position())
+        if self._watcher is not None:
+            self._watcher.added(actor)
+
+    def add_all(self, actors: List['Actor']) -> None:
+        """
+        Add each of the given <actors> in turn, the same as calling add for
+        each of them, but faster when there are many.
+        """
+
+        width, height = self.width, self.height
+        cells, kinds, order = self._cells, self._kinds, self._order
+        for actor in actors:
+            order[actor] = self._next_order
+            self._next_order += 1
+            x, y = actor.x, actor.y
+            if not (0 <= x < width and 0 <= y < height):
+                self._insert(actor, x, y)
+                continue
+
+            # Each actor comes after every actor already in its cell, so it
+            # goes on the end, and is only the first exactly at its tile if
+            # nothing is recorded there yet
+            i = y * width + x
+            cell = cells.get(i)
+            if cell is None:
+                cells[i] = [actor]
+            else:
+                cell.append(actor)
+            if not kinds[i] and not actor.sub_x and not actor.sub_y:
+                kinds[i] = actor.kind
+        if self._changes is not None:
+            self._changes.extend(actor.get_subtile_position()
+                                 for actor in actors)
+        if self._watcher is not None:
+            self._watcher.added_all(actors)
+
+    def remove(self, actor: 'Actor') -> None:
+        """
+        Remove the given <actor> from the index.
+        """
+
+        self._discard(actor, actor.x, actor.y)
+        self._update_kind(actor.x, actor.y)
+        del self._order[actor]
+        if self._changes is not None:
+            self._changes.append(actor.get_subtile_position())
+        if self._motions is not None:
+            self._motions.pop(actor, None)
+        if self._watcher is not None:
+            self._watcher.removed(actor)
+
+    def relocate(self, actor: 'Actor', old_x: int, old_y: int,
+                 old_sub_x: int = 0, old_sub_y: int = 0) -> None:
+        """
+        Move the given <actor> from the tile at <old_x> and <old_y>, where
+        it had the sub-tile offset <old_sub_x> and <old_sub_y>, to its
+        current position.
+        """
+
+        if self._changes is not None or self._motions is not None:
+            old = (old_x * SUBTILE + old_sub_x, old_y * SUBTILE + old_sub_y)
+            if self._changes is not None:
+                self._changes.append(old)
+                self._changes.append(actor.get_subtile_position())
+            if self._motions is not None:
+                self._motions.setdefault(actor, old)
+        if self._watcher is not None:
+            self._watcher.moved(actor)
+
+        new_x, new_y = actor.x, actor.y
+        if old_x != new_x or old_y != new_y:
+            self._discard(actor, old_x, old_y)
+            self._insert(actor, new_x, new_y)
+
+        # The actor may have left or reached a whole tile even if it has not
+        # changed cell
+        self._update_kind(old_x, old_y)
+        if old_x != new_x or old_y != new_y:
+            self._update_kind(new_x, new_y)
+
+    def get_static(self, x: int, y: int) -> int:
+        """
+        Return the kind of static tile at <x> and <y>, or 0 if there is none.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self._static[y * self.width + x]
+        return 0
+
+    def get_static_tiles(self) -> Union[bytearray, memoryview]:
+        """
+        Return the kind of static tile at each tile of the stage, row by row.
+        This is the index's own storage, not a copy.
+        """
+
+        return self._static
+
+    def get_kinds(self) -> bytearray:
+        """
+        Return the kind of the actor get() returns for each tile of the
+        stage, row by row, or EMPTY where it returns None. This is the
+        index's own storage, not a copy, so it stays up to date as actors
+        are added, removed and moved.
+        """
+
+        return self._kinds
+
+    def get_kind(self, x: int, y: int) -> int:
+        """
+        Return the kind of the first actor added to the game exactly at the
+        tile <x> and <y>, or EMPTY if there is no such actor.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self._kinds[y * self.width + x]
+        actor = self.get(x, y)
+        return actor.kind if actor is not None else EMPTY
+
+    def get(self, x: int, y: int) -> Optional['Actor']:
+        """
+        Return the first actor added to the game exactly at the tile <x> and
+        <y>, or None if there is no such actor.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            i = y * self.width + x
+            if not self._kinds[i]:
+                return None
+            if self._static[i]:
+                return self._make_static(self._static[i], x, y)
+            cell = self._cells.get(i)
+        else:
+            cell = self._outside.get((x, y))
+
+        if cell:
+            for actor in cell:
+                if not actor.sub_x and not actor.sub_y:
+                    return actor
+        return None
+
+    def get_empty_tiles(self) -> EmptyTiles:
+        """
+        Return the number (counting row by row) of every tile of the stage
+        that get() returns None for, in order, as they are now.
+        """
+
+        return EmptyTiles(self._kinds)
+
+    def get_all(self, x: int, y: int) -> List['Actor']:
+        """
+        Return every actor exactly at the tile <x> and <y>, in the order
+        they were added to the game.
+        """
+
+        found = []
+        static = self.get_static(x, y)
+        if static:
+            found.append(self._make_static(static, x, y))
+        found.extend(actor for actor in self._cell(x, y)
+                     if not actor.sub_x and not actor.sub_y)
+        return found
+
+    def get_in_area(self, left: int, top: int, right: int,
+                    bottom: int) -> List['Actor']:
+        """
+        Return every actor filed in the tiles from <left> to <right> and from
+        <top> to <bottom> (inclusive), in no particular order. Static tiles
+        are not included.
+        """
+
+        found = []
+        for y in range(top, bottom + 1):
+            for x in range(left, right + 1):
+                found.extend(self._cell(x, y))
+        return found
+
+    def order_of(self, actor: 'Actor') -> int:
+        """
+        Return a number giving the order <actor> was added in; actors added
+        later have larger numbers.
+        """
+
+        return self._order[actor]
+
+    def track_changes(self) -> None:
+        """
+        Start recording every position where an actor is added, removed or
+        moved, discarding anything recorded so far.
+        """
+
+        self._changes = []
+
+    def pop_changes(self) -> List[Tuple[int, int]]:
+        """
+        Return the positions recorded since changes were last popped, and
+        start a new record. Return an empty list if changes are not being
+        tracked.
+        """
+
+        if self._changes is None:
+            return []
+        changes, self._changes = self._changes, []
+        return changes
+
+    def start_motions(self) -> None:
+        """
+        Start recording where each actor that moves from now on moved from,
+        discarding anything recorded so far.
+        """
+
+        self._motions = {}
+
+    def get_motions(self) -> Dict['Actor', Tuple[int, int]]:
+        """
+        Return a map from each actor moved since motions were last started
+        to its position then, in steps of 1 / SUBTILE of a tile. Return an
+        empty map if motions are not being tracked.
+        """
+
+        return self._motions if self._motions is not None else {}
+
+    def watch(self, watcher: Optional['CollisionTracker']) -> None:
+        """
+        Tell the collision tracker <watcher> about every actor added to,
+        removed from or moved in the index from now on, or stop telling one
+        if <watcher> is None.
+        """
+
+        self._watcher = watcher
+
+    def _cell(self, x: int, y: int) -> List['Actor']:
+        """
+        Return the actors filed in the tile at <x> and <y>.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self._cells.get(y * self.width + x, [])
+        return self._outside.get((x, y), [])
+
+    def _insert(self, actor: 'Actor', x: int, y: int) -> None:
+        """
+        Insert the given <actor> into the cell at <x> and <y>, keeping the
+        cell's actors in the order they were added to the game.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            cell = self._cells.setdefault(y * self.width + x, [])
+        else:
+            cell = self._outside.setdefault((x, y), [])
+
+        order = self._order[actor]
+        i = len(cell)
+        while i > 0 and self._order[cell[i - 1]] > order:
+            i -= 1
+        cell.insert(i, actor)
+
+    def _discard(self, actor: 'Actor', x: int, y: int) -> None:
+        """
+        Remove the given <actor> from the cell at <x> and <y>.
+        """
+
+        if 0 <= x < self.width and 0 <= y < self.height:
+            cells, key = self._cells, y * self.width + x
+        else:
+            cells, key = self._outside, (x, y)
+        cell = cells[key]
+        cell.remove(actor)
+        if not cell:
+            del cells[key]
+
+    def _update_kind(self, x: int, y: int) -> None:
+        """
+        Record the kind of the first actor exactly at the tile <x> and <y>,
+        if it is on the stage.
+        """
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return
+        i = y * self.width + x
+        kind = self._static[i]
+        if not kind:
+            for actor in self._cells.get(i, ()):
+                if not actor.sub_x and not actor.sub_y:
+                    kind = actor.kind
+                    break
+        self._kinds[i] = kind
+
+
+class EmptyTiles(Sequence):
+    """
+    The number (counting row by row) of every empty tile of a stage, in
+    order, as a sequence that finds each one only when it is asked for.
+
+    Making the sequence takes a few passes over the stage in C, and finding
+    a tile by its place in the sequence only searches one block of the
+    stage, so a few tiles can be picked at random from a big stage without
+    making a list of every empty tile.
+
+    === Private Attributes ===
+    _empty:
+        1 for each tile of the stage that is empty, and 0 for the others
+    _starts:
+        the place in the sequence of the first empty tile in each block of
+        _BLOCK tiles
+    _length:
+        the number of empty tiles
+    """
+    _empty: Union[bytes, bytearray]
+    _starts: List[int]
+    _length: int
+
+    # The number of tiles in a block
+    _BLOCK = 4096
+
+    def __init__(self, kinds: Union[bytes, bytearray]) -> None:
+        """
+        Initialize the sequence of the tiles whose kind in <kinds>, the kind
+        of each tile of a stage row by row, is EMPTY.
+        """
+
+        self._empty = kinds.translate(_EMPTY_TABLE)
+        self._starts = []
+        self._length = 0
+        for start in range(0, len(self._empty), self._BLOCK):
+            self._starts.append(self._length)
+            self._length += self._empty.count(1, start, start + self._BLOCK)
+
+    def __len__(self) -> int:
+        """
+        Return the number of empty tiles.
+        """
+
+        return self._length
+
+    def __getitem__(self, i: int) -> int:
+        """
+        Return the <i>th empty tile.
+        """
+
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("empty tile index out of range")
+        block = bisect_right(self._starts, i) - 1
+        start = block * self._BLOCK
+        end = start + self._BLOCK
+        tiles = compress(range(start, end), self._empty[start:end])
+        return next(islice(tiles, i - self._starts[block], None))
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        Return an iterator over the empty tiles, in order.
+        """
+
+        # Scan the tiles a byte at a time in C, rather than in a Python loop
+        return compress(range(len(self._empty)), self._empty)
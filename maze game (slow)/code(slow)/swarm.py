@@ -0,0 +1,372 @@
+"""
+This module contains the swarm, which moves all the squishy monsters of a
+level at once with NumPy arrays instead of one monster at a time.
+
+NumPy is only needed when a game is asked to batch its monsters, so this
+module is only imported then.
+"""
+
+from __future__ import annotations
+from typing import Dict, List, Optional
+import numpy as np
+from actors2 import *
+
+# The number for each kind of squishy monster: one that moves diagonally,
+# one that moves horizontally and one that moves vertically
+_DIAGONAL, _HORIZONTAL, _VERTICAL = 0, 1, 2
+_KINDS = {SquishyMonster: _DIAGONAL, SquishyMonster2: _HORIZONTAL,
+          SquishyMonster3: _VERTICAL}
+
+
+class SquishySwarm:
+    """
+    The squishy monsters of a level, moved together in a single turn.
+
+    The swarm keeps the position, direction and delay of each member in
+    arrays, and takes every member's turn at once, in the place of the first
+    member in the game's list of actors. The result is exactly the same as
+    each member moving in turn:
+
+    - A wall, or a box that is the first actor in its tile, blocks a monster.
+      Only monsters move during the swarm's turn, and a monster never steps
+      in front of a box, so these are found once per turn, in a grid of the
+      blocked tiles of the stage.
+    - A vertical monster is also blocked by another monster. One whose way
+      another monster is in, or could step into, this turn is moved on its
+      own, after the members before it have moved.
+    - If anything else could change the result (a monster sharing its tile
+      with a box, or a monster walking off the stage), the members take their
+      turns one by one instead.
+
+    The swarm is scheduled (see Game.schedule) to move only on the ticks
+    some member steps on, and catches up with the members' delay counts for
+    the ticks in between when it does.
+
+    The members' positions and directions are kept up to date as they move,
+    but not their delay counts; call sync before reading those.
+
+    === Private Attributes ===
+    _members:
+        the members of the swarm, in the order of the game's actors,
+        including members that have been removed from the game
+    _slots:
+        map from each member still in the game to its position in _members
+    _alive:
+        whether each member is still in the game
+    _kind:
+        the kind of each member
+    _x, _y:
+        the position of each member
+    _dx, _dy:
+        the direction each member steps in
+    _delay:
+        the time in seconds each member waits between steps
+    _phase:
+        the delay count of each member as of the end of tick _tick; a member
+        steps on a tick that starts with it at 0
+    _tick:
+        the tick of the game's current level _phase is as of the end of
+    _blocked:
+        whether the tile at each position of the stage is a wall, row by row
+    _boxes:
+        the boxes in the game
+    _width, _height:
+        the size of the stage
+    """
+    _members: List[SquishyMonster]
+    _slots: Dict[SquishyMonster, int]
+    _alive: np.ndarray
+    _kind: np.ndarray
+    _x: np.ndarray
+    _y: np.ndarray
+    _dx: np.ndarray
+    _dy: np.ndarray
+    _delay: np.ndarray
+    _phase: np.ndarray
+    _tick: int
+    _blocked: np.ndarray
+    _boxes: List[Box]
+    _width: int
+    _height: int
+
+    # A swarm is only moved on the ticks it is scheduled for
+    scheduled: bool = True
+
+    def __init__(self, members: List[SquishyMonster], boxes: List[Box],
+                 index: SpatialIndex, tick: int) -> None:
+        """
+        Initialize a swarm of the given <members>, in the order they move, on
+        the stage of the spatial <index> with the given <boxes> on it, after
+        the given <tick> of the game's current level.
+        """
+
+        self._width, self._height = index.width, index.height
+        self._blocked = np.frombuffer(index.get_static_tiles(),
+                                      dtype=np.uint8) == WALL
+        self._boxes = boxes
+        self._members = members
+        self._tick = tick
+        self._load()
+
+    @staticmethod
+    def gather(actors: List[Actor], index: SpatialIndex,
+               tick: int) -> Optional[SquishySwarm]:
+        """
+        Return a swarm of the squishy monsters in <actors>, the actors of a
+        game in the order they were added, after the given <tick> of its
+        current level, or None if there are none or their turns cannot be
+        taken together. The monsters' delay counts must be up to date (see
+        Actor.set_wait).
+        """
+
+        first, last = None, None
+        for i, actor in enumerate(actors):
+            if isinstance(actor, SquishyMonster):
+                if type(actor) not in _KINDS:
+                    return None
+                if first is None:
+                    first = i
+                last = i
+        if first is None:
+            return None
+        # Idle actors do nothing when they move, so the swarm can take its
+        # members' turns early without passing them
+        if not all(isinstance(actor, SquishyMonster) or actor.idle
+                   for actor in actors[first:last + 1]):
+            return None
+
+        return SquishySwarm(
+            [a for a in actors[first:last + 1] if isinstance(a, SquishyMonster)],
+            [a for a in actors if isinstance(a, Box)], index, tick)
+
+    def first(self) -> SquishyMonster:
+        """
+        Return the member whose place in the game's actors the swarm moves
+        in.
+        """
+
+        return self._members[0]
+
+    def discard(self, actor: Actor) -> bool:
+        """
+        Stop moving the given <actor> if it is a member, as it has been
+        removed from the game. Return True iff it was a member.
+        """
+
+        slot = self._slots.pop(actor, None)
+        if slot is None:
+            return False
+        self._alive[slot] = False
+        if len(self._slots) * 2 < len(self._members):
+            self._take_out_removed()
+        return True
+
+    def sync(self, game: 'Game') -> None:
+        """
+        Copy the delay count of each member still in the <game> onto the
+        member, as of the tick the game is on.
+        """
+
+        self._catch_up(game, game.get_tick())
+        for member, phase in zip(self._members, self._phase.tolist()):
+            member._delay_count = phase
+
+    def get_wait(self, game: 'Game') -> int:
+        """
+        Return the number of ticks after the current one of the <game> the
+        first of the members still in it to step next steps on.
+        """
+
+        if not self._slots:
+            return 1
+        return self._catch_up(game, game.get_tick())
+
+    def move(self, game: 'Game') -> None:
+        """
+        Take the turn of every member still in the <game>, then wait for the
+        next tick a member steps on.
+        """
+
+        if not self._slots:
+            return
+
+        # No member stepped on the ticks since the swarm last moved
+        self._catch_up(game, game.get_tick() - 1)
+        stepping = self._alive & (self._phase == 0)
+        if stepping.any() and not self._step(game, stepping):
+            self._move_one_by_one(game, stepping)
+        game.schedule(self, self._catch_up(game, game.get_tick()))
+
+    def _catch_up(self, game: 'Game', tick: int) -> int:
+        """
+        Bring the members' delay counts up to the end of the given <tick> of
+        the <game>'s current level. Return the number of ticks after it the
+        first of the members still in the game to step next steps on.
+        """
+
+        # The same as Game.ticks_for, which rounds halves to even like NumPy
+        period = np.maximum(1, np.round(self._delay * game.get_tick_rate()))
+        period = period.astype(np.int64)
+        self._phase = (self._phase + tick - self._tick) % period
+        self._tick = tick
+        waits = -self._phase[self._alive] % period[self._alive]
+        return int(waits.min()) + 1 if len(waits) else 1
+
+    def _step(self, game: 'Game', stepping: np.ndarray) -> bool:
+        """
+        Take a step with each member where <stepping> is True, in order.
+        Return False, without moving any member, if the steps cannot be
+        worked out together.
+        """
+
+        width, height = self._width, self._height
+        kind, x, y = self._kind, self._x, self._y
+        vertical = kind == _VERTICAL
+        dx = np.where(vertical, 0, self._dx)
+        dy = np.where(kind == _HORIZONTAL, 0, self._dy)
+        to_x, to_y = x + dx, y + dy
+        if not _on_stage(to_x, to_y, width, height, stepping):
+            return False
+
+        index = game.get_spatial_index()
+        box_tiles = self._box_tiles(index)
+        if box_tiles is None:
+            return False
+
+        def blocked(tiles: np.ndarray) -> np.ndarray:
+            """Return whether a wall or box blocks each of the <tiles>."""
+            return self._blocked[tiles] | np.isin(tiles, box_tiles)
+
+        to_tile = np.where(stepping, to_y * width + to_x, 0)
+        blocked_to = stepping & blocked(to_tile)
+        goes = stepping & ~blocked_to
+        new_x, new_y = np.where(goes, to_x, x), np.where(goes, to_y, y)
+
+        # Diagonal and horizontal monsters turn if the way on from where
+        # they end up is blocked, vertical ones if the way they tried was
+        turning = stepping & ~vertical
+        if not _on_stage(new_x + dx, new_y + dy, width, height, turning):
+            return False
+        on_tile = np.where(turning, (new_y + dy) * width + new_x + dx, 0)
+        turns = np.where(vertical, blocked_to, turning & blocked(on_tile))
+
+        # A vertical monster is also blocked by a monster, so it is moved on
+        # its own if any other monster is in, or could step into, its way
+        alone = stepping & vertical
+        if alone.any():
+            taken = np.concatenate(((y * width + x)[self._alive],
+                                    (new_y * width + new_x)[goes & ~vertical],
+                                    to_tile[alone]))
+            tiles, counts = np.unique(taken, return_counts=True)
+            found = np.minimum(np.searchsorted(tiles, to_tile), len(tiles) - 1)
+            alone &= (tiles[found] == to_tile) & (counts[found] > 1)
+
+        members = self._members
+        kinds = kind.tolist()
+        new_x, new_y = new_x.tolist(), new_y.tolist()
+        changed = np.flatnonzero(goes | turns | alone).tolist()
+        goes, turns, alone = goes.tolist(), turns.tolist(), alone.tolist()
+        for i in changed:
+            member = members[i]
+            if alone[i]:
+                member.step(game)
+                self._y[i], self._dy[i] = member.y, member._dy
+                continue
+            if goes[i]:
+                # Move the member in one go, rather than a tile across and
+                # then a tile down
+                old_x, old_y = member._x, member._y
+                member._x, member._y = new_x[i], new_y[i]
+                index.relocate(member, old_x, old_y)
+                self._x[i], self._y[i] = new_x[i], new_y[i]
+            if turns[i]:
+                if kinds[i] != _VERTICAL:
+                    member._dx = -member._dx
+                    self._dx[i] = member._dx
+                if kinds[i] != _HORIZONTAL:
+                    member._dy = -member._dy
+                    self._dy[i] = member._dy
+        return True
+
+    def _box_tiles(self, index: SpatialIndex) -> Optional[np.ndarray]:
+        """
+        Return the tiles, numbered row by row, of the boxes on the stage of
+        <index> that are the first actor in their tile, or None if a member
+        shares a tile with a box.
+        """
+
+        tiles = []
+        for box in self._boxes:
+            if box._index is None or not (0 <= box.x < self._width
+                                          and 0 <= box.y < self._height):
+                continue
+            found = index.get_all(box.x, box.y)
+            if any(actor in self._slots for actor in found):
+                return None
+            if found[0] is box:
+                tiles.append(box.y * self._width + box.x)
+        return np.array(tiles, dtype=np.int64)
+
+    def _move_one_by_one(self, game: 'Game', stepping: np.ndarray) -> None:
+        """
+        Take a step with each member still in the <game> where <stepping> is
+        True, one at a time.
+        """
+
+        for member, steps in zip(self._members, stepping.tolist()):
+            if steps and member in self._slots:
+                member.step(game)
+        self._load_positions()
+
+    def _take_out_removed(self) -> None:
+        """
+        Take the members that have been removed from the game out of the
+        swarm.
+        """
+
+        alive = self._alive
+        self._members = [member for member, kept
+                         in zip(self._members, alive.tolist()) if kept]
+        self._slots = {member: i for i, member in enumerate(self._members)}
+        self._kind, self._x, self._y = \
+            self._kind[alive], self._x[alive], self._y[alive]
+        self._dx, self._dy = self._dx[alive], self._dy[alive]
+        self._delay, self._phase = self._delay[alive], self._phase[alive]
+        self._alive = np.ones(len(self._members), dtype=bool)
+
+    def _load(self) -> None:
+        """
+        Fill the arrays from the members.
+        """
+
+        members = self._members
+        self._slots = {member: i for i, member in enumerate(members)}
+        self._alive = np.ones(len(members), dtype=bool)
+        self._kind = np.array([_KINDS[type(m)] for m in members], dtype=np.int8)
+        self._delay = np.array([m._delay for m in members], dtype=float)
+        self._phase = np.array([m._delay_count for m in members],
+                               dtype=np.int64)
+        self._load_positions()
+
+    def _load_positions(self) -> None:
+        """
+        Fill the arrays of the members' positions and directions from the
+        members.
+        """
+
+        members = self._members
+        self._x = np.array([m.x for m in members], dtype=np.int64)
+        self._y = np.array([m.y for m in members], dtype=np.int64)
+        self._dx = np.array([m._dx for m in members], dtype=np.int64)
+        self._dy = np.array([m._dy for m in members], dtype=np.int64)
+
+
+def _on_stage(x: np.ndarray, y: np.ndarray, width: int, height: int,
+              where: np.ndarray) -> bool:
+    """
+    Return True iff every position <x> and <y> where <where> is True is on a
+    stage of the given <width> and <height>.
+    """
+
+    return bool(np.all(((0 <= x) & (x < width) & (0 <= y) & (y < height))
+                       | ~where))